@@ -11,6 +11,7 @@ import discord
 
 from configurations import CONFIG
 from discord_fake_classes import FakeMessage
+from models import AsyncDB, WriteBehindQueue
 
 IMMEDIATE_RECONNECT_TIME = datetime.timedelta(milliseconds=500)
 
@@ -57,8 +58,37 @@ class BaseBot(discord.Client):
         self.bot_start = datetime.datetime.now()
         self.bot_connect = None
         self.downtimes = datetime.timedelta(seconds=0)
+        self.session = None
         log.debug(f'__init__ reset uptime to {self.bot_start}.')
 
+    @staticmethod
+    def create_http_session():
+        """
+        Одна долгоживущая сессия с пулом соединений, чтобы не открывать TLS-соединение на каждый запрос.
+        Общего ограничения на время запроса нет, чтобы большие загрузки не обрывались, его задаёт api_timeout.
+        """
+        connector = aiohttp.TCPConnector(limit=CONFIG.get('http_connection_limit', 100),
+                                         keepalive_timeout=CONFIG.get('http_keepalive_seconds', 60))
+        timeout = aiohttp.ClientTimeout(total=None,
+                                        connect=CONFIG.get('http_connect_timeout_seconds', 10),
+                                        sock_read=CONFIG.get('http_read_timeout_seconds', 60))
+        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    @staticmethod
+    def api_timeout():
+        """Ограничение на короткие запросы к API, где ждать дольше нет смысла"""
+        return aiohttp.ClientTimeout(total=CONFIG.get('http_api_timeout_seconds', 30))
+
+    async def setup_hook(self):
+        self.session = self.create_http_session()
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+        await WriteBehindQueue.get().flush()
+        await AsyncDB.get().close()
+        await super().close()
+
     async def on_disconnect(self):
         if self.bot_connect > self.bot_disconnect:
             self.bot_disconnect = datetime.datetime.now()
@@ -135,8 +165,7 @@ class BaseBot(discord.Client):
             return await message.channel.send(content=content)
         return await message.channel.send(embed=embed)
 
-    @staticmethod
-    async def send_slash_command_result(message, embed, content, file=None,
+    async def send_slash_command_result(self, message, embed, content, file=None,
                                       response_type=InteractionResponseType.CHANNEL_MESSAGE_WITH_SOURCE):
         try:
             endpoint = f'interactions/{message.interaction_id}/{message.interaction_token}/callback'
@@ -152,9 +181,9 @@ class BaseBot(discord.Client):
                 },
                 'flags': 0,
             }
-            async with aiohttp.ClientSession() as session:
-                try:
-                    r = await session.post(url, headers={"Authorization": f"Bot {os.getenv('DISCORD_TOKEN')}"}, json=response)
+            try:
+                async with self.session.post(url, headers={"Authorization": f"Bot {os.getenv('DISCORD_TOKEN')}"},
+                                             json=response, timeout=self.api_timeout()) as r:
                     if r.status == 404:
                         log.warning(f"Interaction {message.interaction_id} expired or not found")
                         # Для устаревших взаимодействий отправляем сообщение в канал
@@ -164,12 +193,12 @@ class BaseBot(discord.Client):
                             await message.channel.send(embed=embed)
                     else:
                         r.raise_for_status()
-                except discord.NotFound:
-                    log.warning(f"Interaction {message.interaction_id} not found, sending regular message")
-                    if content:
-                        await message.channel.send(content=content)
-                    if embed:
-                        await message.channel.send(embed=embed)
+            except discord.NotFound:
+                log.warning(f"Interaction {message.interaction_id} not found, sending regular message")
+                if content:
+                    await message.channel.send(content=content)
+                if embed:
+                    await message.channel.send(embed=embed)
             return message.id
         except Exception as e:
             log.error(f"Error in send_slash_command_result: {str(e)}")
@@ -180,8 +209,8 @@ class BaseBot(discord.Client):
     async def delete_slash_command_interaction(self, message):
         endpoint = f'webhooks/{self.application_id}/{message.interaction_token}/messages/@original'
         url = f'https://discord.com/api/v8/{endpoint}'
-        async with aiohttp.ClientSession() as session:
-            r = await session.delete(url, headers={"Authorization": f"Bot {os.getenv('DISCORD_TOKEN')}"})
+        async with self.session.delete(url, headers={"Authorization": f"Bot {os.getenv('DISCORD_TOKEN')}"},
+                                       timeout=self.api_timeout()) as r:
             if r.status != 404:
                 r.raise_for_status()
 
@@ -276,11 +305,12 @@ class BaseBot(discord.Client):
                 '```',
             ]
 
-            with self.session.post(host, data='\n'.join(data_lines), headers={
+            async with self.session.post(host, data='\n'.join(data_lines), headers={
                 'Title': f'Exception in {event}',
                 'Priority': 'urgent',
                 'Tags': 'rotating_light',
-                'Markdown': 'yes',            }, auth=(CONFIG.get('ntfy_user'), CONFIG.get('ntfy_pass'))):
+                'Markdown': 'yes',            }, auth=(CONFIG.get('ntfy_user'), CONFIG.get('ntfy_pass')),
+                                         timeout=self.api_timeout()):
                 pass
             await super().on_error(event, *args, **kwargs)
 
@@ -299,9 +329,8 @@ class BaseBot(discord.Client):
             await self.fetch_emojis_from_guild(guild_id)
         if not self.my_emojis:
             log.error('No emojis found in either local storage or Discord guilds')
-            return
 
-        # Обновляем эмодзи в связанных объектах если они есть
+        # Обновляем эмодзи в связанных объектах если они есть, в том числе пустые, чтобы сбросить кэши
         components = {
             'views': getattr(self, 'views', None),
             'expander': getattr(self, 'expander', None),
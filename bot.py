@@ -10,7 +10,6 @@ import urllib
 from functools import partial, partialmethod
 from typing import Optional
 
-import aiohttp
 import discord
 from dotenv import load_dotenv
 import humanize
@@ -22,11 +21,13 @@ import graphic_map
 import graphic_soulforge_preview
 import models
 from base_bot import BaseBot, InteractionResponseType, log
-from command_registry import COMMAND_REGISTRY, add_slash_command, get_all_commands, remove_slash_command
+from command_registry import COMMAND_REGISTRY, COMMAND_ROUTER, add_slash_command, get_all_commands, remove_slash_command
 from configurations import CONFIG, TOKEN
 from discord_fake_classes import FakeMessage
 from discord_wrappers import admin_required, guild_required, owner_required
 from game_constants import CAMPAIGN_COLORS, RARITY_COLORS
+from graphic_renderer import Renderer
+from jobs.news_dispatcher import NewsDispatcher
 from jobs.news_downloader import NewsDownloader
 from models.ban import Ban
 from models.bookmark import BookmarkError
@@ -78,13 +79,13 @@ class DiscordBot(BaseBot):
         self.pet_rescues = []
         self.pet_rescue_config: Optional[PetRescueConfig] = None
         self.server_status_cache = {'last_updated': datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)}
-        self.session = None
+        self.renderer = Renderer()
 
     async def on_guild_join(self, guild):
         await super().on_guild_join(guild)
         first_writable_channel = self.first_writable_channel(guild)
 
-        if ban := Ban.get(guild.id):
+        if ban := await Ban.get(guild.id):
             log.debug(f'Guild {guild} ({guild.id}) was banned by {ban["author_name"]} because: {ban["reason"]}')
             if first_writable_channel:
                 try:
@@ -242,28 +243,18 @@ class DiscordBot(BaseBot):
                     pass
 
     async def get_function_for_command(self, user_command, user_prefix):
-        log.debug(f"Checking command: {user_command} with prefix: {user_prefix}")
-        for command in COMMAND_REGISTRY:
-            log.debug(f"Testing pattern: {command['pattern']} for command: {command['function']}")
-            match = command['pattern'].search(user_command)
-            if not match:
-                log.debug(f"No match for pattern: {command['pattern']}")
-                continue
-            groups = match.groupdict()
-            log.debug(f"Match found. Groups: {groups}")
-
-            if groups.get('prefix', user_prefix) == user_prefix:
-                log.debug(f"Prefix matches. Returning function: {command['function']}")
-                return getattr(self, command['function'], None), groups
-        log.debug("No matching command found.")
-        return None, None
+        command, groups = COMMAND_ROUTER.route(user_command, user_prefix)
+        if not command:
+            return None, None
+        log.debug(f"Match found for {command['function']}. Groups: {groups}")
+        return getattr(self, command['function'], None), groups
 
     @owner_required
     async def world_map(self, message, lang, location='krystara', **__):
         async with message.channel.typing():
             start = time.time()
             map_data = self.expander.get_map_data(lang, location)
-            image_data = graphic_map.render_all(map_data)
+            image_data = await self.renderer.render(graphic_map, map_data, self.session)
             result = discord.File(image_data, 'gow_world_map.png')
             duration = time.time() - start
             message = message
@@ -283,15 +274,8 @@ class DiscordBot(BaseBot):
                                                      content='Please stand by ...',
                                                      embed=None)
             start = time.time()
-            campaign_data = self.expander.get_campaign_tasks(lang)
-            campaign_data['switch'] = switch
-            campaign_data['task_skip_costs'] = self.expander.task_skip_costs
-            campaign_data['team'] = None
-            campaign_data['week'] = _('[WEEK]', lang).format(self.expander.campaign_week)
-            campaign_data['campaign_name'] = _(self.expander.campaign_name, lang)
-            if team_code:
-                campaign_data['team'] = self.expander.get_team_from_message(team_code, lang)
-            image_data = graphic_campaign_preview.render_all(campaign_data)
+            campaign_data = self.get_campaign_preview_data(lang, switch, team_code)
+            image_data = await self.renderer.render(graphic_campaign_preview, campaign_data, self.session)
             result = discord.File(image_data, f'campaign_{lang}_{campaign_data["raw_date"]}.png')
             duration = time.time() - start
             message = message
@@ -299,6 +283,17 @@ class DiscordBot(BaseBot):
             log.debug(f'Campaign generation took {duration:0.2f} seconds.')
             await message.channel.send(file=result)
 
+    def get_campaign_preview_data(self, lang, switch, team_code=None):
+        campaign_data = self.expander.get_campaign_tasks(lang)
+        campaign_data['switch'] = switch
+        campaign_data['task_skip_costs'] = self.expander.task_skip_costs
+        campaign_data['team'] = None
+        campaign_data['week'] = _('[WEEK]', lang).format(self.expander.campaign_week)
+        campaign_data['campaign_name'] = _(self.expander.campaign_name, lang)
+        if team_code:
+            campaign_data['team'] = self.expander.get_team_from_message(team_code, lang)
+        return campaign_data
+
     @owner_required
     async def soulforge_preview(self, message, lang, search_term, release_date=None, switch=None, **__):
         if switch is None:
@@ -315,7 +310,7 @@ class DiscordBot(BaseBot):
                                   description=':(',
                                   color=self.BLACK)
                 return await self.answer(message, e)
-            image_data = graphic_soulforge_preview.render_all(weapon_data)
+            image_data = await self.renderer.render(graphic_soulforge_preview, weapon_data, self.session)
             result = discord.File(image_data, f'soulforge_{release_date}.png')
             duration = time.time() - start
             message = message
@@ -474,6 +469,7 @@ class DiscordBot(BaseBot):
         color = discord.Color.from_rgb(*RARITY_COLORS['Mythic'])
         e = discord.Embed(title=_('[PVPSTATS]', lang), description='<https://garyatrics.com/>', color=color)
         members = sum(g.member_count for g in self.guilds)
+        rescue_amount = await PetRescue.get_amount()
 
         with HumanizeTranslator(LANGUAGE_CODE_MAPPING.get(lang, lang)) as _t:
             collections = [
@@ -484,7 +480,7 @@ class DiscordBot(BaseBot):
                 f'**{_("[NEWS]", lang)} {_("[CHANNELS]", lang)} (Switch)**: '
                 f'{humanize.intcomma(sum(s.get("switch", True) for s in self.subscriptions))}',
                 f'**{_("[PETRESCUE]", lang)} ({_("[JUST_NOW]", lang)})**: {humanize.intcomma(len(self.pet_rescues))}',
-                f'**{_("[PETRESCUE]", lang)} ({_("[TRAIT_ALL]", lang)})**: {humanize.intcomma(PetRescue.get_amount())}',
+                f'**{_("[PETRESCUE]", lang)} ({_("[TRAIT_ALL]", lang)})**: {humanize.intcomma(rescue_amount)}',
             ]
             e.add_field(name=_("[COLLECTION]", lang), value='\n'.join(collections))
 
@@ -696,7 +692,7 @@ class DiscordBot(BaseBot):
         await self.answer(message, e)
 
     async def pet_rescue_stats(self, message, lang, **__):
-        raw_stats = PetRescue.get_stats()
+        raw_stats = await PetRescue.get_stats()
         stats, rescues = self.expander.translate_pet_rescue_stats(raw_stats, lang)
         e = self.views.render_pet_rescue_stats(stats, rescues, lang)
         await self.answer(message, e)
@@ -878,7 +874,7 @@ class DiscordBot(BaseBot):
 
     async def memes(self, message, lang, meme_no=None, **__):
         base_url = 'https://garyatrics.com/images/memes'
-        async with self.session.get(f'{base_url}/index.txt') as r:
+        async with self.session.get(f'{base_url}/index.txt', timeout=self.api_timeout()) as r:
             content = await r.text()
             available_memes = [m for m in content.split('\n') if m]
         random_title = _('[SPELLEFFECT_CAUSERANDOM]', lang)
@@ -903,7 +899,8 @@ class DiscordBot(BaseBot):
         now = datetime.datetime.now(datetime.timezone.utc)
         if self.server_status_cache['last_updated'] <= now - datetime.timedelta(seconds=30):
             async with message.channel.typing():
-                async with self.session.get('https://status.infinityplustwo.net/status_v2.txt') as r:
+                async with self.session.get('https://status.infinityplustwo.net/status_v2.txt',
+                                            timeout=self.api_timeout()) as r:
                     await asyncio.sleep(2)
                     status = await r.json(content_type='text/plain') if r.ok else {'pGameArray': []}
                     self.server_status_cache['status'] = status['pGameArray'][:-1]
@@ -1085,7 +1082,7 @@ class DiscordBot(BaseBot):
         await self.answer(message, e)
 
     async def show_bookmark(self, message, bookmark_id, lang, shortened='', **__):
-        bookmark = self.expander.bookmarks.get(bookmark_id)
+        bookmark = await self.expander.bookmarks.get(bookmark_id)
         if not bookmark:
             e = self.generate_response('Bookmark', self.BLACK, 'Error', f'Bookmark id `{bookmark_id}` does not exist.')
             return await self.answer(message, e)
@@ -1093,7 +1090,7 @@ class DiscordBot(BaseBot):
         return await self.team_code(message, lang, bookmark['team_code'], title=title, shortened=shortened)
 
     async def show_my_bookmarks(self, message, **__):
-        bookmarks = self.expander.bookmarks.get_my_bookmarks(message.author.id)
+        bookmarks = await self.expander.bookmarks.get_my_bookmarks(message.author.id)
         e = self.views.render_my_bookmarks(bookmarks, message.author.display_name)
         await self.answer(message, e)
 
@@ -1116,7 +1113,7 @@ class DiscordBot(BaseBot):
         await self.answer(message, e)
 
     async def show_toplist(self, message, toplist_id, lang, **__):
-        toplist = self.expander.translate_toplist(toplist_id, lang)
+        toplist = await self.expander.translate_toplist(toplist_id, lang)
         e = self.views.render_toplist(toplist)
         await self.answer(message, e)
 
@@ -1138,7 +1135,7 @@ class DiscordBot(BaseBot):
             toplist_ids = self.expander.get_toplist_troop_ids(items, lang)
             items = ','.join(toplist_ids)
             await self.expander.toplists.append(toplist_id, message.author.id, message.author.display_name, items)
-            toplist = self.expander.translate_toplist(toplist_id, lang)
+            toplist = await self.expander.translate_toplist(toplist_id, lang)
             e = self.views.render_toplist(toplist)
         except ToplistError as te:
             e = self.generate_response('Toplist', self.BLACK, THERE_WAS_A_PROBLEM, str(te))
@@ -1154,7 +1151,7 @@ class DiscordBot(BaseBot):
         await self.answer(message, e)
 
     async def show_my_toplists(self, message, **__):
-        toplists = self.expander.toplists.get_my_toplists(message.author.id)
+        toplists = await self.expander.toplists.get_my_toplists(message.author.id)
         e = self.views.render_my_toplists(toplists, message.author.display_name)
         await self.answer(message, e)
 
@@ -1207,30 +1204,28 @@ class DiscordBot(BaseBot):
             articles.reverse()
         if articles:
             log.debug(f'Distributing {len(articles)} news articles to {len(self.subscriptions)} channels.')
-        for article in articles:
-            await self.send_out_news(article)
+            await self.send_out_news(articles)
         with open(NewsDownloader.NEWS_FILENAME, 'w') as f:
             f.write('[]')
 
-    async def send_out_news(self, article):
-        embeds = self.views.render_news(article)
-        relevant_subscriptions = [s for s in self.subscriptions if s.get(article['platform'])]
-        for i, subscription in enumerate(relevant_subscriptions):
-            channel = self.get_channel(subscription['channel_id'])
-            if not channel:
-                log.debug(f'Subscription {subscription} is broken, skipping.')
-                continue
+    async def send_out_news(self, articles):
+        # Все статьи для одного канала отправляются по порядку, разные каналы обслуживаются параллельно
+        deliveries = {}
+        for article in articles:
+            embeds = self.views.render_news(article)
+            for subscription in self.subscriptions:
+                if not subscription.get(article['platform']):
+                    continue
+                channel = self.get_channel(subscription['channel_id'])
+                if not channel:
+                    log.debug(f'Subscription {subscription} is broken, skipping.')
+                    continue
+                deliveries.setdefault(channel, []).extend(embeds)
+        for channel in list(deliveries):
             if not await self.is_writable(channel):
                 log.debug(f'Channel "{channel}" is not writable.')
-                continue
-            log.debug(f'[{i + 1}/{len(relevant_subscriptions)}] Sending [{article["platform"]}] {article["title"]} '
-                      f'to {channel.guild.name}/{channel.name}.')
-            for e in embeds:
-                try:
-                    await channel.send(embed=e)
-                except discord.DiscordException as ex:
-                    log.error(f'Could not send out news to "{channel}", exception follows')
-                    log.exception(ex)
+                del deliveries[channel]
+        await NewsDispatcher().send_all(deliveries)
 
     @guild_required
     @admin_required
@@ -1295,7 +1290,7 @@ class DiscordBot(BaseBot):
 
     @owner_required
     async def ban_guild(self, message, guild_id, reason, **__):
-        Ban.add(int(guild_id), reason, message.author.display_name)
+        await Ban.add(int(guild_id), reason, message.author.display_name)
         await self.kick_guild(message=message, guild_id=guild_id)
 
     async def weekly_summary(self, message, lang, **__):
@@ -1350,13 +1345,21 @@ class DiscordBot(BaseBot):
     task_update_pet_rescues = bot_tasks.task_update_pet_rescues
     task_update_status = bot_tasks.task_report_status
     task_update_game_data = bot_tasks.task_update_game_data
+    task_log_cache_stats = bot_tasks.task_log_cache_stats
     async def setup_hook(self):
+        await super().setup_hook()
+        # до подключения к Discord команды ещё не приходят, индексы спокойно строятся в потоке
+        await asyncio.to_thread(self.expander.build_search_indexes)
         self.task_check_for_news.start()
         self.task_check_for_data_updates.start()
         self.task_update_pet_rescues.start()
         self.task_update_status.start()
         self.task_update_game_data.start()
-        self.session = aiohttp.ClientSession()
+        self.task_log_cache_stats.start()
+
+    async def close(self):
+        self.renderer.close()
+        await super().close()
 
 
 if __name__ == '__main__':
@@ -1,19 +1,104 @@
 import asyncio
+import contextlib
+import copy
 import datetime
 import os
 import json
+import time
 
+import humanize
 from discord.ext import tasks
 from game_assets import GameAssets
 
 from base_bot import log
 from configurations import CONFIG
 from jobs.news_downloader import NewsDownloader
+from jobs.preview_prerenderer import PreviewPrerenderer
 from jobs.status_reporter import StatusReporter
-from search import TeamExpander, update_translations
+from search import TeamExpander, load_translations, t
 from translations import LANG_FILES
 
 
+# Одна блокировка на все перезагрузки данных, чтобы они не шли одновременно
+reload_lock = asyncio.Lock()
+# Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора
+background_tasks = set()
+
+
+def build_expander(expander, modified_files):
+    """
+    Собирает новый TeamExpander с готовыми поисковыми индексами в рабочем потоке, не трогая текущий.
+    Новые переводы не устанавливаются, индексы строятся по ним только внутри этого потока.
+    :param expander: текущий TeamExpander
+    :param modified_files: имена изменившихся файлов
+    :return: новый TeamExpander и новые таблицы переводов (None, если переводы не менялись)
+    """
+    world_files = [f for f in modified_files if f not in LANG_FILES]
+    world = expander.world
+    if world_files:
+        # Копия мира, чтобы при ошибке бот продолжил работать со старыми данными
+        world = copy.copy(expander.world)
+        stages = world.reload(world_files)
+        log.debug(f'Reloaded game data stages: {", ".join(stages) or "none"}.')
+    all_translations = None
+    if len(world_files) != len(modified_files):
+        all_translations = load_translations()
+    with t.staging(all_translations) if all_translations else contextlib.nullcontext():
+        new_expander = TeamExpander(world, bookmarks=expander.bookmarks, toplists=expander.toplists)
+        if world_files:
+            # Инициализируем пустые пользовательские данные чтобы убрать отладочные сообщения
+            new_expander.user_data = {}
+        new_expander.build_search_indexes()
+    return new_expander, all_translations
+
+
+async def measure_loop_blocking(coroutine, interval=0.05):
+    """
+    Ждёт корутину и замеряет самую долгую задержку цикла событий за это время,
+    то есть сколько максимум ждали обработки команды.
+    :return: результат корутины и задержка в секундах
+    """
+    loop = asyncio.get_running_loop()
+    longest_delay = 0
+
+    async def monitor():
+        nonlocal longest_delay
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            longest_delay = max(longest_delay, loop.time() - started - interval)
+
+    monitor_task = asyncio.create_task(monitor())
+    try:
+        result = await coroutine
+    finally:
+        monitor_task.cancel()
+    return result, longest_delay
+
+
+async def reload_game_data(discord_client, modified_files):
+    """Перезагружает данные в отдельном потоке и атомарно подменяет discord_client.expander"""
+    async with reload_lock:
+        started = time.monotonic()
+        old_expander = discord_client.expander
+        (expander, all_translations), blocked = await measure_loop_blocking(
+            asyncio.to_thread(build_expander, old_expander, modified_files))
+        if expander:
+            expander.my_emojis = old_expander.my_emojis
+            # переводы и поисковые индексы по ним подменяются вместе
+            if all_translations:
+                t.install(all_translations)
+            discord_client.expander = expander
+            discord_client.renderer.cache.clear()
+            prerenderer = PreviewPrerenderer()
+            if prerenderer.is_triggered_by(modified_files):
+                task = asyncio.create_task(prerenderer.run(discord_client))
+                background_tasks.add(task)
+                task.add_done_callback(background_tasks.discard)
+        log.info(f'Game data reloaded in {time.monotonic() - started:.2f}s, '
+                 f'commands were blocked for at most {blocked * 1000:.0f}ms.')
+
+
 @tasks.loop(minutes=1, reconnect=True)
 async def task_report_status(discord_client):
     status = StatusReporter()
@@ -30,6 +115,16 @@ async def task_update_pet_rescues(discord_client):
         await rescue.create_or_edit_posts(e)
 
 
+@tasks.loop(minutes=CONFIG.get('cache_stats_interval_minutes', 60), reconnect=True)
+async def task_log_cache_stats(discord_client):
+    cache = discord_client.expander.translation_cache.stats()
+    render_cache = discord_client.renderer.cache.stats()
+    log.info(f'Translation cache: {cache["size"]} / {cache["maxsize"]}, {cache["hits"]} hits, '
+             f'{cache["misses"]} misses ({cache["hit_ratio"]:.0%}). '
+             f'Render cache: {render_cache["size"]} images, {humanize.naturalsize(render_cache["bytes"])}, '
+             f'{render_cache["hits"]} hits, {render_cache["misses"]} misses ({render_cache["hit_ratio"]:.0%}).')
+
+
 @tasks.loop(minutes=CONFIG.get('news_check_interval_minutes'), reconnect=False)
 async def task_check_for_news(discord_client):
     lock = asyncio.Lock()
@@ -45,7 +140,7 @@ async def task_check_for_news(discord_client):
 
 @tasks.loop(seconds=CONFIG.get('file_update_check_seconds'))
 async def task_check_for_data_updates(discord_client):
-    filenames = LANG_FILES + ['World.json', 'Soulforge.json', 'Event.json', 'Store.json']
+    filenames = LANG_FILES + ['World.json', 'Campaign.json', 'Soulforge.json', 'Event.json', 'Store.json']
     now = datetime.datetime.now()
     modified_files = []
     for filename in filenames:
@@ -60,21 +155,11 @@ async def task_check_for_data_updates(discord_client):
     if modified_files:
         log.debug(f'Game file modification detected, reloading {", ".join(modified_files)}.')
         await asyncio.sleep(5)
-        lock = asyncio.Lock()
-        async with lock:
-            try:
-                old_expander = discord_client.expander
-                del discord_client.expander
-
-                # Инициализируем пустые пользовательские данные чтобы убрать отладочные сообщения
-                discord_client.expander = TeamExpander()
-                discord_client.expander.user_data = {}
-
-                update_translations()
-            except Exception as e:
-                log.error('Could not update game file. Stacktrace follows.')
-                log.exception(e)
-                discord_client.expander = old_expander
+        try:
+            await reload_game_data(discord_client, modified_files)
+        except Exception as e:
+            log.error('Could not update game file. Stacktrace follows.')
+            log.exception(e)
 
 
 @tasks.loop(hours=24)  # Проверяем раз в день
@@ -84,6 +169,7 @@ async def task_update_game_data(discord_client):
         'World.json': 'https://garyatrics.com/game-data/World.json',
         'GemsOfWar_Russian.json': 'https://garyatrics.com/game-data/GemsOfWar_Russian.json'
     }
+    updated_files = []
 
     for filename, url in files_to_update.items():
         file_path = os.path.join('game_assets', filename)
@@ -101,6 +187,7 @@ async def task_update_game_data(discord_client):
                         json.dump(new_data, f, indent=2)
 
                     log.info(f'{filename} успешно обновлен')
+                    updated_files.append(filename)
                 else:
                     log.error(f'Не удалось загрузить {filename}: HTTP {response.status}')
                     continue
@@ -111,15 +198,9 @@ async def task_update_game_data(discord_client):
             continue
 
     # После обновления всех файлов перезагружаем данные в боте
-    lock = asyncio.Lock()
-    async with lock:
-        try:
-            old_expander = discord_client.expander
-            discord_client.expander = TeamExpander()
-            discord_client.expander.user_data = {}
-            update_translations()
-            log.info('Данные успешно перезагружены')
-        except Exception as e:
-            log.error('Ошибка при перезагрузке данных')
-            log.exception(e)
-            discord_client.expander = old_expander
+    try:
+        await reload_game_data(discord_client, updated_files)
+        log.info('Данные успешно перезагружены')
+    except Exception as e:
+        log.error('Ошибка при перезагрузке данных')
+        log.exception(e)
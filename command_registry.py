@@ -1217,6 +1217,84 @@ for command in COMMAND_REGISTRY.copy():
         COMMAND_REGISTRY.append(new_command)
 
 
+class CommandRouter:
+    """
+    Отбирает команды-кандидаты по первому символу ключевого слова после префикса,
+    полное регулярное выражение проверяется только для них.
+    Команды, для которых ключевое слово не удалось вывести из шаблона (например, код команды), проверяются всегда.
+    """
+    MODIFIERS = ('', '-', '+')
+    PREFIX_GROUP = '(?P<prefix>.)'
+    # Начало ключевого слова: обязательная буква или группа вариантов без вложенных групп, возможно необязательная
+    KEYWORD_START = re.compile(r'\((?:\?:)?(?P<alternatives>[^()]*)\)(?P<optional>\?)?|(?P<char>\w)(?![?*{])')
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.by_keyword = {}
+        self.fallback = []
+        for position, command in enumerate(registry):
+            first_chars = self.get_keyword_first_chars(command['pattern'])
+            if first_chars is None:
+                self.fallback.append(position)
+                continue
+            for char in first_chars:
+                self.by_keyword.setdefault(char, []).append(position)
+
+    @classmethod
+    def get_keyword_first_chars(cls, pattern):
+        """
+        Возможные первые символы ключевого слова, выведенные из текста шаблона после группы префикса.
+        :return: множество символов или None, если шаблон слишком сложный и команду нужно проверять всегда
+        """
+        _, found, keyword = pattern.pattern.partition(cls.PREFIX_GROUP)
+        if not found:
+            return
+        result = set()
+        position = 0
+        while match := cls.KEYWORD_START.match(keyword, position):
+            if match['char']:
+                return result | {match['char'].lower()}
+            alternatives = match['alternatives'].split('|')
+            if any(len(a) < 1 or not a[0].isalnum() or a[1:2] in ('?', '*', '{') for a in alternatives):
+                return
+            result |= {a[0].lower() for a in alternatives}
+            if not match['optional']:
+                return result
+            position = match.end()
+
+    def get_keyword_chars(self, user_command, user_prefix):
+        """Первые символы после префикса для всех допустимых вариантов языка и модификатора в каждой строке"""
+        result = set()
+        for line in user_command.split('\n'):
+            lowered = line.lower()
+            starts = [0] + [len(lang) for lang in LANGUAGES if lowered.startswith(lang)]
+            for start in starts:
+                for modifier in self.MODIFIERS:
+                    position = start + len(modifier)
+                    if line.startswith(modifier, start) and line.startswith(user_prefix, position):
+                        result.add(lowered[position + len(user_prefix):position + len(user_prefix) + 1])
+        return result
+
+    def get_candidates(self, user_command, user_prefix):
+        positions = set(self.fallback)
+        for char in self.get_keyword_chars(user_command, user_prefix):
+            positions.update(self.by_keyword.get(char, []))
+        return [self.registry[position] for position in sorted(positions)]
+
+    def route(self, user_command, user_prefix):
+        for command in self.get_candidates(user_command, user_prefix):
+            match = command['pattern'].search(user_command)
+            if not match:
+                continue
+            groups = match.groupdict()
+            if groups.get('prefix', user_prefix) == user_prefix:
+                return command, groups
+        return None, None
+
+
+COMMAND_ROUTER = CommandRouter(COMMAND_REGISTRY)
+
+
 # taken from https://github.com/eunwoo1104/discord-py-slash-command
 async def add_slash_command(bot_id,
                             bot_token: str,
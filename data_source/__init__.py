@@ -6,6 +6,7 @@ from data_source.trait import Trait
 from data_source.troop import Troop
 from data_source.weapon import Weapon
 from translations import LANGUAGE_CODE_MAPPING
+from util import extract_search_tag
 
 
 class Collection:
@@ -35,10 +36,11 @@ class Collection:
             return []
 
         possible_matches = []
+        compacted_search = extract_search_tag(search_term)
         for item in self.items.values():
-            if item.matches_precisely(search_term, lang):
+            if item.matches_tag_precisely(compacted_search, lang):
                 return [item.translations[lang]]
-            elif item.matches(search_term, lang, **kwargs):
+            elif item.matches_tag(compacted_search, lang, **kwargs):
                 possible_matches.append(item.translations[lang])
         return possible_matches
 
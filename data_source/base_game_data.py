@@ -1,10 +1,12 @@
 import copy
 import datetime
+from collections import OrderedDict
 
 import translations
+from configurations import CONFIG
 from util import dig, extract_search_tag
 
-_ = translations.Translations().get
+_ = translations._instance.get
 
 
 class BaseGameData:
@@ -24,6 +26,9 @@ class BaseGameData:
         return item in self.data
 
     def __getattr__(self, item):
+        # служебные атрибуты (например, при распаковке pickle) в data не ищем
+        if item.startswith('__'):
+            raise AttributeError(item)
         return self.data[item]
 
     def __str__(self):
@@ -31,30 +36,94 @@ class BaseGameData:
                f' kingdom={self.data["kingdom_id"]}>'
 
 
+class LanguageCache:
+    """
+    Переводы контейнера: язык переводится при первом обращении,
+    хранятся только несколько последних использованных языков.
+    """
+
+    def __init__(self, container):
+        self.container = container
+        self.size = CONFIG.get('translation_cache_languages', 3)
+        self.items = OrderedDict()
+        self.search_tags = {}
+        self.version = translations._instance.version
+
+    def __getitem__(self, lang):
+        if self.version != translations._instance.version:
+            self.clear()
+        if item := self.items.get(lang):
+            self.items.move_to_end(lang)
+            return item
+        if lang not in translations.LOCALE_MAPPING:
+            raise KeyError(lang)
+        item = self.container.translate_one_language(lang)
+        self.items[lang] = item
+        while len(self.items) > self.size:
+            self.items.popitem(last=False)
+        return item
+
+    def __contains__(self, lang):
+        return lang in translations.LOCALE_MAPPING
+
+    def values(self):
+        """Только уже переведённые языки"""
+        return list(self.items.values())
+
+    def get_search_tags(self, lang):
+        """Поисковые теги считаются один раз на язык и не вытесняются вместе с переводом"""
+        if self.version != translations._instance.version:
+            self.clear()
+        if (tags := self.search_tags.get(lang)) is None:
+            item = self[lang]
+            tags = {k: extract_search_tag(dig(item, k)) for k in {'name', *self.container.LOOKUP_KEYS}}
+            self.search_tags[lang] = tags
+        return tags
+
+    def clear(self):
+        self.items = OrderedDict()
+        self.search_tags = {}
+        self.version = translations._instance.version
+
+    def __getstate__(self):
+        # переводы не попадают в снимок мира, они собираются заново из актуальных файлов
+        return {'container': self.container, 'size': self.size}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.clear()
+
+
 class BaseGameDataContainer:
     DATA_CLASS = None
     LOOKUP_KEYS = []
+    kingdom_reference_name = None
 
     def __init__(self):
         self.data = {}
-        self.translations = {}
+        self.translations = LanguageCache(self)
 
     def translate_one_language(self, lang):
         item = copy.deepcopy(self.data)
         self.deep_translate(item, lang)
         if self.is_untranslated(item['name']) and 'reference_name' in item:
             item['name'] = item['reference_name']
-        self.translations[lang] = self.DATA_CLASS(item)
+        if self.kingdom_reference_name and self.is_untranslated(_(self.data['kingdom_name'], 'en')):
+            item['kingdom_name'] = self.kingdom_reference_name
+        return self.DATA_CLASS(item)
 
     def translate(self):
-        for lang in translations.LOCALE_MAPPING.keys():
-            self.translate_one_language(lang)
+        """Сбрасывает переводы, каждый язык будет заново переведён при обращении к нему"""
+        self.translations.clear()
 
     @staticmethod
     def is_untranslated(param):
         return param[0] + param[-1] == '[]' if param else True
 
     def __getattr__(self, item):
+        # служебные атрибуты (например, при распаковке pickle) в data не ищем
+        if item.startswith('__'):
+            raise AttributeError(item)
         return self.data[item]
 
     def __getitem__(self, item):
@@ -74,20 +143,19 @@ class BaseGameDataContainer:
 
     def set_release_date(self, release_date):
         self.data['release_date'] = release_date
-        for lang in translations.LOCALE_MAPPING.keys():
-            self.translations[lang].set_release_date(release_date)
+        for item in self.translations.values():
+            item.set_release_date(release_date)
 
     def matches(self, search_term, lang, **kwargs):
-        compacted_search = extract_search_tag(search_term)
-        item = self.translations[lang]
-        if item.name == '`?`':
+        return self.matches_tag(extract_search_tag(search_term), lang, **kwargs)
+
+    def matches_tag(self, compacted_search, lang, **kwargs):
+        tags = self.translations.get_search_tags(lang)
+        if tags['name'] == '`?`':
             return False
         lookup_keys = ['name'] if kwargs.get('name_only') else self.LOOKUP_KEYS
-        lookups = {
-            k: extract_search_tag(dig(item, k)) for k in lookup_keys
-        }
         now = datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc)
-        for key, lookup in lookups.items():
+        for key in lookup_keys:
             if kwargs.get('released_only') and self.data.get('release_date') and self.data['release_date'] > now:
                 continue
             if kwargs.get('no_starry') and self.data.get('reference_name').lower().startswith('starry'):
@@ -98,14 +166,18 @@ class BaseGameDataContainer:
                     continue
                 if '’' in reference and reference.split('’')[1].startswith('sgolden'):
                     continue
-            if compacted_search in lookup:
+            if compacted_search in tags[key]:
                 return True
         return False
 
     def matches_precisely(self, search_term, lang):
-        return extract_search_tag(self.translations[lang].name) == extract_search_tag(search_term)
+        return self.matches_tag_precisely(extract_search_tag(search_term), lang)
+
+    def matches_tag_precisely(self, compacted_search, lang):
+        return self.translations.get_search_tags(lang)['name'] == compacted_search
 
     def fill_untranslated_kingdom_name(self, kingdom_id, kingdom_reference_name):
-        if self.data['kingdom_id'] == kingdom_id and self.is_untranslated(self.translations['en'].kingdom_name):
-            for item in self.translations.values():
-                item.set_kingdom_name(kingdom_reference_name)
+        # подставляется только при переводе, чтобы в снимок мира не попадали данные из файлов переводов
+        if self.data['kingdom_id'] == kingdom_id:
+            self.kingdom_reference_name = kingdom_reference_name
+            self.translations.clear()
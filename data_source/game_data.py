@@ -1,8 +1,11 @@
 import datetime
+import hashlib
+import logging
 import math
 import operator
+import os
+import pickle
 import re
-import logging
 
 log = logging.getLogger(__name__)
 
@@ -26,6 +29,70 @@ NON_CRAFTABLE_WEAPON_IDS = [
     1239, 1250, 1251, 1252, 1272, 1273, 1274, 1275, 1286, 1287, 1294, 1295, 1296, 1317
 ]
 
+WORLD_FILE = 'World.json'
+# Разделы World.json, которые используются при заполнении мира, остальные даже не разбираются
+WORLD_SECTIONS = {'Artifacts', 'HeroClasses', 'Kingdoms', 'Pets', 'Spells', 'TalentTrees', 'Traits', 'Troops',
+                  'Weapons'}
+# Необязательные файлы с данными и атрибуты, в которые они загружаются
+OPTIONAL_SOURCES = {
+    'Campaign.json': 'campaign_data',
+    'Soulforge.json': 'soulforge_raw_data',
+    'Event.json': 'event_raw_data',
+    'Store.json': 'store_raw_data',
+}
+
+# Этапы заполнения мира в порядке выполнения.
+# Все этапы строятся из World.json, поэтому его изменение перестраивает мир целиком.
+POPULATE_STAGES = [
+    'populate_spells',
+    'populate_traits',
+    'populate_troops',
+    'populate_pets',
+    'populate_kingdoms',
+    'populate_weapons',
+    'populate_talents',
+    'populate_classes',
+    'populate_release_dates',
+    'enrich_kingdoms',
+    'add_troops_to_kingdoms_by_filename',
+    'populate_campaign_tasks',
+    'populate_soulforge',
+    'populate_traitstones',
+    'populate_hero_levels',
+    'populate_max_power_levels',
+    'populate_adventure_board',
+    'populate_drop_chances',
+    'populate_event_key_drops',
+    'populate_event_kingdoms',
+    'populate_store_data',
+    'populate_weekly_event_details',
+    'populate_gem_events',
+    'populate_hoard_potions',
+    'populate_orbs',
+]
+# Этапы, которые зависят от необязательных файлов. Они должны целиком пересоздавать свои атрибуты,
+# чтобы их можно было перезапустить поверх копии уже заполненного мира.
+STAGE_SOURCES = {
+    'populate_campaign_tasks': {'Campaign.json'},
+    'populate_soulforge': {'Soulforge.json'},
+    'populate_event_key_drops': {'Event.json'},
+    'populate_store_data': {'Store.json'},
+    'populate_weekly_event_details': {'Event.json'},
+    'populate_gem_events': {'Event.json'},
+}
+# Этапы, использующие результаты других этапов
+STAGE_DEPENDENCIES = {
+    'populate_weekly_event_details': {'populate_store_data'},
+}
+
+# Снимок уже заполненного мира, чтобы не разбирать World.json при каждом запуске.
+# Версию нужно увеличивать при любом изменении структуры GameData.
+SNAPSHOT_VERSION = 5
+SNAPSHOT_FILENAME = 'World.snapshot'
+SNAPSHOT_SOURCES = [WORLD_FILE, *OPTIONAL_SOURCES]
+# Разделы сырых данных World.json, которые ещё нужны после заполнения мира
+RETAINED_RAW_SECTIONS = ['Artifacts']
+
 
 class GameData:
 
@@ -52,6 +119,7 @@ class GameData:
         self.soulforge_weapons = []
         self.campaign_tasks = {}
         self.campaign_data = {}
+        self.soulforge_raw_data = {}
         self.campaign_skip_costs = {}
         self.campaign_rerolls = {}
         self.campaign_week = None
@@ -74,45 +142,24 @@ class GameData:
         self.orbs = {}
         self.user_data = {}  # TODO: Initialize with actual user data source
 
-    def read_json_data(self):
-        """Загружает все необходимые JSON файлы с данными игры"""
+    def read_json_data(self, filenames=None):
+        """Загружает все необходимые JSON файлы с данными игры, либо только перечисленные"""
         try:
-            self.data = GameAssets.load('World.json')
-            log.debug("Загружен World.json")
-
-            # Инициализация пустых структур данных для безопасной работы
-            self.campaign_data = {}
-            self.soulforge_raw_data = {}
-            self.event_raw_data = {}
-            self.store_raw_data = {}
-
-            try:
-                if GameAssets.exists('Campaign.json'):
-                    self.campaign_data = GameAssets.load('Campaign.json')
-                    log.debug("Загружен Campaign.json")
-            except Exception as e:
-                log.warning(f"Не удалось загрузить Campaign.json: {e}")
-
-            try:
-                if GameAssets.exists('Soulforge.json'):
-                    self.soulforge_raw_data = GameAssets.load('Soulforge.json')
-                    log.debug("Загружен Soulforge.json")
-            except Exception as e:
-                log.warning(f"Не удалось загрузить Soulforge.json: {e}")
-
-            try:
-                if GameAssets.exists('Event.json'):
-                    self.event_raw_data = GameAssets.load('Event.json')
-                    log.debug("Загружен Event.json")
-            except Exception as e:
-                log.warning(f"Не удалось загрузить Event.json: {e}")
-
-            try:
-                if GameAssets.exists('Store.json'):
-                    self.store_raw_data = GameAssets.load('Store.json')
-                    log.debug("Загружен Store.json")
-            except Exception as e:
-                log.warning(f"Не удалось загрузить Store.json: {e}")
+            if filenames is None or WORLD_FILE in filenames:
+                self.data = GameAssets.load_sections(WORLD_FILE, WORLD_SECTIONS)
+                log.debug(f"Загружен {WORLD_FILE}")
+
+            for filename, attribute in OPTIONAL_SOURCES.items():
+                if filenames is not None and filename not in filenames:
+                    continue
+                # Инициализация пустых структур данных для безопасной работы
+                setattr(self, attribute, {})
+                try:
+                    if GameAssets.exists(filename):
+                        setattr(self, attribute, GameAssets.load(filename))
+                        log.debug(f"Загружен {filename}")
+                except Exception as e:
+                    log.warning(f"Не удалось загрузить {filename}: {e}")
 
         except KeyError as e:
             log.error(f"Missing key in JSON data: {e}")
@@ -122,33 +169,114 @@ class GameData:
             raise
 
     def populate_world_data(self):
+        use_snapshot = CONFIG.get('world_snapshot', True)
+        snapshot_key = self.get_snapshot_key() if use_snapshot else None
+        if use_snapshot and self.load_snapshot(snapshot_key):
+            self.populate_date_dependent_data()
+            return
+
         self.read_json_data()
+        self.run_stages(POPULATE_STAGES)
+        self.release_raw_data()
 
-        self.populate_spells()
-        self.populate_traits()
-        self.populate_troops()
-        self.pets = Pets(self.data['Pets'], {}, self.troops)
-        self.populate_kingdoms()
-        self.populate_weapons()
-        self.populate_talents()
-        self.populate_classes()
-        self.populate_release_dates()
-        self.enrich_kingdoms()
-        self.add_troops_to_kingdoms_by_filename()
+        if use_snapshot:
+            self.save_snapshot(snapshot_key)
+
+    def run_stages(self, stages):
+        for stage in stages:
+            getattr(self, stage)()
+
+    def release_raw_data(self):
+        """Сырой World.json после заполнения не нужен, кроме пары разделов"""
+        self.data = {section: self.data[section] for section in RETAINED_RAW_SECTIONS if section in self.data}
+
+    @staticmethod
+    def get_affected_stages(changed_files):
+        """Этапы, которые нужно перезапустить после изменения файлов, вместе с зависящими от них"""
+        affected = set()
+        for stage in POPULATE_STAGES:
+            sources = STAGE_SOURCES.get(stage, set()) | {WORLD_FILE}
+            if sources & changed_files or STAGE_DEPENDENCIES.get(stage, set()) & affected:
+                affected.add(stage)
+        return [stage for stage in POPULATE_STAGES if stage in affected]
+
+    def reload(self, changed_files):
+        """
+        Перестраивает только то, что зависит от изменившихся файлов.
+        Изменение World.json пересобирает мир целиком.
+        :param changed_files: имена изменившихся файлов в game_assets
+        :return: список перезапущенных этапов
+        """
+        changed_files = set(changed_files)
+        if WORLD_FILE in changed_files:
+            self.__init__()
+            self.populate_world_data()
+            return POPULATE_STAGES
+
+        stages = self.get_affected_stages(changed_files)
+        if not stages:
+            return stages
+        self.read_json_data(changed_files)
+        self.run_stages(stages)
+        if CONFIG.get('world_snapshot', True):
+            self.save_snapshot(self.get_snapshot_key())
+        return stages
+
+    def populate_date_dependent_data(self):
+        """Пересчитывает данные, зависящие от текущей даты, а не от содержимого файлов"""
+        self.campaign_week = None
+        self.event_kingdoms = []
         self.populate_campaign_tasks()
-        self.populate_soulforge()
-        self.populate_traitstones()
-        self.populate_hero_levels()
-        self.populate_max_power_levels()
-        self.populate_adventure_board()
-        self.populate_drop_chances()
-        self.populate_event_key_drops()
         self.populate_event_kingdoms()
-        self.populate_store_data()
-        self.populate_weekly_event_details()
-        self.populate_gem_events()
-        self.populate_hoard_potions()
-        self.populate_orbs()
+
+    @staticmethod
+    def get_snapshot_key():
+        """Хэш содержимого всех исходных файлов, из которых строится мир"""
+        digest = hashlib.sha256(str(SNAPSHOT_VERSION).encode())
+        for filename in SNAPSHOT_SOURCES:
+            if not GameAssets.exists(filename):
+                continue
+            digest.update(filename.encode())
+            with open(GameAssets.path(filename), 'rb') as f:
+                while chunk := f.read(1024 * 1024):
+                    digest.update(chunk)
+        return digest.hexdigest()
+
+    def load_snapshot(self, snapshot_key):
+        path = GameAssets.path(SNAPSHOT_FILENAME)
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, 'rb') as f:
+                version, key = pickle.load(f)
+                if version != SNAPSHOT_VERSION or key != snapshot_key:
+                    log.debug(f"Снимок мира устарел: {path}")
+                    return False
+                state = pickle.load(f)
+        except Exception as e:
+            log.warning(f"Не удалось загрузить снимок мира {path}: {e}")
+            return False
+        self.__dict__.update(state)
+        log.debug(f"Загружен снимок мира {path}")
+        return True
+
+    def save_snapshot(self, snapshot_key):
+        state = self.__dict__.copy()
+        path = GameAssets.path(SNAPSHOT_FILENAME)
+        temp_path = f'{path}.tmp'
+        try:
+            with open(temp_path, 'wb') as f:
+                pickle.dump((SNAPSHOT_VERSION, snapshot_key), f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+            log.debug(f"Сохранён снимок мира {path}")
+        except Exception as e:
+            log.warning(f"Не удалось сохранить снимок мира {path}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def populate_pets(self):
+        self.pets = Pets(self.data['Pets'], {}, self.troops)
 
     def populate_classes(self):
         for _class in self.data['HeroClasses']:
@@ -355,6 +483,8 @@ class GameData:
             if artifact['Id'] == self.artifact_id:
                 self.campaign_name = artifact['Name']
 
+        self.campaign_tasks = {}
+        self.campaign_rerolls = {}
         tasks = []
         rerolls = []
 
@@ -375,6 +505,7 @@ class GameData:
         self.populate_campaign_skip_costs()
 
     def populate_campaign_skip_costs(self):
+        self.campaign_skip_costs = {}
         level_names = {
             'CampaignBronze': '[MEDAL_LEVEL_0]',
             'CampaignSilver': '[MEDAL_LEVEL_1]',
@@ -949,6 +1080,7 @@ class GameData:
             # Продолжаем обработку для других типов событий
 
     def populate_gem_events(self):
+        self.gem_events = {}
         for gem_event in []:
             color = COLORS[gem_event['GemType']]
             self.gem_events[gem_event['Id']] = {
@@ -960,6 +1092,7 @@ class GameData:
             }
 
     def populate_store_data(self):
+        self.store_data = {}
         for entry in []:
             if not entry['Visible']:
                 continue
@@ -1052,3 +1185,8 @@ class GameData:
                 'chance': chances[i],
                 'group': orb_groups[i] if i < len(orb_groups) else None,  # Проверяем границы orb_groups
             }
+
+
+if __name__ == '__main__':
+    # Сборка снимка заранее, например при деплое: python -m data_source.game_data
+    GameData().populate_world_data()
@@ -1,4 +1,4 @@
-from data_source.base_game_data import BaseGameData, BaseGameDataContainer
+from data_source.base_game_data import BaseGameData, BaseGameDataContainer, _
 from util import convert_color_array
 from base_bot import log
 
@@ -29,6 +29,7 @@ class PetContainer(BaseGameDataContainer):
     EFFECT_BONUS = {}
     user_data = {}
     world_data = {}
+    effect_kingdom_name = None
 
     def __init__(self, data, user_data, world_data):
         super().__init__()
@@ -147,22 +148,22 @@ class PetContainer(BaseGameDataContainer):
             bonus_name = f'[PETTYPE_{bonus["EffectName"].upper()}]'
             self.EFFECT_BONUS[bonus_name] = bonus['Bonuses']
 
-    def translate(self):
-        super().translate()
-        for translation in self.translations.values():
-            if 'effect_replacement' in translation:
-                for before, after in translation.data['effect_replacement'].items():
-                    if after is None:
-                        after = ''
-                    translation.data['effect'] = translation.data['effect'].replace(before, after)
+    def translate_one_language(self, lang):
+        translation = super().translate_one_language(lang)
+        if 'effect_replacement' in translation:
+            for before, after in translation.data['effect_replacement'].items():
+                if after is None:
+                    after = ''
+                translation.data['effect'] = translation.data['effect'].replace(before, after)
+        if self.effect_kingdom_name and self.is_untranslated(_(self.data['effect_data'], 'en')):
+            translation.set_effect_data(self.effect_kingdom_name)
+        return translation
 
     def fill_untranslated_kingdom_name(self, kingdom_id, kingdom_reference_name):
         super().fill_untranslated_kingdom_name(kingdom_id, kingdom_reference_name)
-        if self.data['effect'] == '[PETTYPE_BUFFTEAMKINGDOM]' \
-                and self.is_untranslated(self.translations['en'].effect_data) \
-                and str(kingdom_id) in self.translations['en'].effect_data:
-            for pet in self.translations.values():
-                pet.set_effect_data(kingdom_reference_name)
+        if self.data['effect'] == '[PETTYPE_BUFFTEAMKINGDOM]' and str(kingdom_id) in (self.data['effect_data'] or ''):
+            self.effect_kingdom_name = kingdom_reference_name
+            self.translations.clear()
 
     def __repr__(self):
         return f'<{self.data["filename"]} id={self.data["id"]} name={self.data["reference_name"]!r} ' \
@@ -1,11 +1,139 @@
 import json
 import os
 import logging
+import re
 
 from configurations import CONFIG
 
 log = logging.getLogger(__name__)
 
+
+class JsonSectionReader:
+    """
+    Читает объект верхнего уровня JSON-файла по одному разделу, не загружая в память весь файл.
+    Ненужные разделы пропускаются без разбора.
+    """
+    CHUNK_SIZE = 256 * 1024
+    WHITESPACE = re.compile(r'\s*')
+    STRUCTURE = re.compile(r'[{}\[\]"]')
+    STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+    SCALAR_END = re.compile(r'[\s,}\]]')
+    MEMBER = re.compile(r'\s*,?\s*("[^"\\]*(?:\\.[^"\\]*)*")\s*:', re.S)
+    decoder = json.JSONDecoder()
+
+    def __init__(self, f):
+        self.f = f
+        self.buffer = ''
+        self.pos = 0
+
+    def read_more(self):
+        chunk = self.f.read(self.CHUNK_SIZE)
+        if not chunk:
+            raise ValueError(f'Unexpected end of JSON file {self.f.name}')
+        self.buffer += chunk
+
+    def compact(self):
+        if self.pos > self.CHUNK_SIZE:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+
+    def skip_whitespace(self):
+        while True:
+            self.pos = self.WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            self.read_more()
+
+    def expect(self, char):
+        if self.skip_whitespace() != char:
+            raise ValueError(f'Expected {char!r} at position {self.pos} of {self.f.name}')
+        self.pos += 1
+
+    def match_string(self, pos, keep):
+        while not (match := self.STRING.match(self.buffer, pos)):
+            pos = self.drop_consumed(pos, keep)
+            self.read_more()
+        return match.end()
+
+    def drop_consumed(self, pos, keep):
+        """При пропуске раздела уже просмотренный текст не нужен"""
+        if keep:
+            return pos
+        self.buffer = self.buffer[pos:]
+        self.pos = 0
+        return 0
+
+    def read_scalar(self):
+        """Строки и числа разбираем сразу, дочитывая файл, если значение оборвалось на границе буфера"""
+        while True:
+            try:
+                if self.buffer[self.pos] != '"' and not self.SCALAR_END.search(self.buffer, self.pos):
+                    raise ValueError('Number may be cut off')
+                value, self.pos = self.decoder.raw_decode(self.buffer, self.pos)
+                return value
+            except ValueError:
+                self.read_more()
+
+    def read_value(self, keep=True):
+        first = self.skip_whitespace()
+        start = self.pos
+        if keep and first not in '{[':
+            return self.read_scalar()
+        if first in '{[':
+            depth = 0
+            pos = self.pos
+            while True:
+                match = self.STRUCTURE.search(self.buffer, pos)
+                if not match:
+                    pos = self.drop_consumed(len(self.buffer), keep)
+                    self.read_more()
+                    continue
+                pos = match.start()
+                char = match.group()
+                if char == '"':
+                    pos = self.match_string(pos, keep)
+                    continue
+                depth += 1 if char in '{[' else -1
+                pos += 1
+                if depth == 0:
+                    break
+        elif first == '"':
+            pos = self.match_string(self.pos, keep)
+        else:
+            while not (match := self.SCALAR_END.search(self.buffer, self.pos)):
+                self.read_more()
+            pos = match.start()
+        if not keep:
+            self.pos = pos
+            return None
+        value = json.loads(self.buffer[start:pos])
+        self.pos = pos
+        return value
+
+    def sections(self, wanted=None):
+        self.expect('{')
+        while True:
+            self.compact()
+            # быстрый путь для ключа, целиком попавшего в буфер
+            if match := self.MEMBER.match(self.buffer, self.pos):
+                key = match.group(1)
+                key = json.loads(key) if '\\' in key else key[1:-1]
+                self.pos = match.end()
+            else:
+                char = self.skip_whitespace()
+                if char == '}':
+                    return
+                if char == ',':
+                    self.pos += 1
+                    continue
+                key = self.read_value()
+                self.expect(':')
+            keep = wanted is None or key in wanted
+            value = self.read_value(keep)
+            if keep:
+                yield key, value
+
+
 class GameAssets:
     @staticmethod
     def load(filename):
@@ -27,3 +155,20 @@ class GameAssets:
         path = os.path.join(CONFIG.get('game_assets_folder'), filename)
         log.debug(f"Checking existence of file: {path}")
         return os.path.exists(path)
+
+    @staticmethod
+    def iter_sections(filename, sections=None):
+        """
+        Потоково читает разделы верхнего уровня JSON-файла.
+        :param filename: имя файла в game_assets
+        :param sections: нужные разделы, остальные пропускаются без разбора; None - все
+        :return: генератор пар (раздел, данные)
+        """
+        path = GameAssets.path(filename)
+        log.debug(f"Streaming file: {path}")
+        with open(path, encoding='utf8') as f:
+            yield from JsonSectionReader(f).sections(sections)
+
+    @staticmethod
+    def load_sections(filename, sections=None):
+        return dict(GameAssets.iter_sections(filename, sections))
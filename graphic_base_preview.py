@@ -1,19 +1,59 @@
+import asyncio
 import io
 import os
-from textwrap import wrap
+from collections import OrderedDict
 
+import aiohttp
 import requests
 from wand.color import Color
 from wand.drawing import Drawing
 from wand.image import Image
 
+from configurations import CONFIG
+from text_layout import TextLayout
+
 BASE_URL = 'https://garyatrics.com/gow_assets'
+CACHE_PATH = '.cache'
+MAX_CONCURRENT_DOWNLOADS = 10
 FONTS = {
     'opensans': r'fonts/OpenSans-Regular.ttf',
     'raleway': r'fonts/Raleway-Regular.ttf',
 }
 
 
+class ImageCache:
+    """
+    Уже декодированные и уменьшенные картинки в памяти процесса рендера.
+    Объём ограничен по оценке памяти пикселей, давно не использованные картинки вытесняются первыми.
+    Наружу отдаются только копии, поэтому их можно свободно изменять.
+    """
+    BYTES_PER_PIXEL = 8
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.images = OrderedDict()
+        self.bytes = 0
+
+    def get(self, key, load):
+        if key in self.images:
+            self.images.move_to_end(key)
+            return self.images[key][0].clone()
+        img = load()
+        size = img.width * img.height * self.BYTES_PER_PIXEL
+        if size > self.max_bytes:
+            return img
+        self.images[key] = img, size
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (evicted, evicted_size) = self.images.popitem(last=False)
+            self.bytes -= evicted_size
+            evicted.close()
+        return img.clone()
+
+
+IMAGE_CACHE = ImageCache(CONFIG.get('image_cache_max_mb', 256) * 1024 * 1024)
+
+
 class BasePreview:
     def __init__(self, data):
         self.data = data
@@ -23,12 +63,8 @@ class BasePreview:
     def render_background(self, title):
         self.img = download_image(self.data['background'])
         self.spacing = self.img.width // 2 - 980
-        gow_logo = download_image(self.data['gow_logo'])
-        ratio = gow_logo.width / gow_logo.height
-        gow_logo.resize(round(200 * ratio), 200)
-        switch_logo = Image(filename='switch_logo.png')
-        ratio = switch_logo.width / switch_logo.height
-        switch_logo.resize(round(100 * ratio), 100)
+        gow_logo = download_image(self.data['gow_logo'], height=200)
+        switch_logo = open_image('switch_logo.png', height=100)
         with Drawing() as draw:
             color = Color('rgba(0, 0, 0, 0.7)')
             draw.fill_color = color
@@ -49,9 +85,8 @@ class BasePreview:
             y_offset = 120 if '\n' in title else 200
             draw.text(450, y_offset, title.format(self.data))
 
-            kingdom_logo = download_image(self.data['kingdom_logo'])
-            kingdom_width, kingdom_height = scale_down(kingdom_logo.width, kingdom_logo.height, 220)
-            kingdom_logo.resize(kingdom_width, kingdom_height)
+            kingdom_logo = download_image(self.data['kingdom_logo'], max_size=220)
+            kingdom_width, kingdom_height = kingdom_logo.size
             draw.composite(operator='atop',
                            left=self.img.width - kingdom_width - 15, top=15,
                            width=kingdom_width, height=kingdom_height,
@@ -66,9 +101,8 @@ class BasePreview:
             draw.text(x, y, kingdom)
 
             if self.data.get('alternate_kingdom'):
-                kingdom_logo = download_image(self.data['alternate_kingdom_logo'])
-                kingdom_width, kingdom_height = scale_down(kingdom_logo.width, kingdom_logo.height, 220)
-                kingdom_logo.resize(kingdom_width, kingdom_height)
+                kingdom_logo = download_image(self.data['alternate_kingdom_logo'], max_size=220)
+                kingdom_width, kingdom_height = kingdom_logo.size
                 draw.composite(operator='atop',
                                left=self.img.width - 2 * (kingdom_width + 15) - 15, top=15,
                                width=kingdom_width, height=kingdom_height,
@@ -86,7 +120,7 @@ class BasePreview:
 
     def draw_watermark(self):
         with Drawing() as draw:
-            avatar = Image(filename='gary.png')
+            avatar = open_image('gary.png')
             max_size = 100
             width, height = scale_down(*avatar.size, max_size)
             draw.composite(operator='atop',
@@ -129,28 +163,97 @@ class BasePreview:
             draw(self.img)
 
 
-def download_image(path):
-    cache_path = '.cache'
-    cache_filename = os.path.join(cache_path, path)
+def get_cache_filename(path):
+    return os.path.join(CACHE_PATH, path)
+
+
+def write_cache_file(path, content):
+    cache_filename = get_cache_filename(path)
+    os.makedirs(os.path.dirname(cache_filename), exist_ok=True)
+    # через временный файл, чтобы параллельный рендер никогда не прочитал недописанную картинку
+    temp_filename = f'{cache_filename}.{os.getpid()}.tmp'
+    with open(temp_filename, 'wb') as cache:
+        cache.write(content)
+    os.replace(temp_filename, cache_filename)
+
+
+def resize_image(img, max_size=None, height=None, size=None):
+    """
+    :param max_size: уменьшить с сохранением пропорций так, чтобы большая сторона стала max_size
+    :param height: привести к высоте height с сохранением пропорций
+    :param size: привести к точному размеру (ширина, высота)
+    """
+    if max_size:
+        img.resize(*scale_down(img.width, img.height, max_size))
+    elif height:
+        img.resize(round(height * img.width / img.height), height)
+    elif size:
+        img.resize(*size)
+    return img
+
+
+def fetch_image(path):
+    cache_filename = get_cache_filename(path)
     if os.path.exists(cache_filename):
         f = open(cache_filename, 'rb')
     else:
         url = f'{BASE_URL}/{path}'
         r = requests.get(url)
         r.raise_for_status()
+        write_cache_file(path, r.content)
         f = io.BytesIO(r.content)
-        cache_subdir = os.path.dirname(cache_filename)
-        if not os.path.exists(cache_subdir):
-            os.makedirs(cache_subdir)
-        with open(cache_filename, 'wb') as cache:
-            cache.write(f.read())
-        f.seek(0)
     img = Image(file=f)
     img.alpha_channel = True
     f.close()
     return img
 
 
+def download_image(path, max_size=None, height=None, size=None):
+    """Картинка из ассетов игры через IMAGE_CACHE, параметры размера как у resize_image"""
+    cache_filename = get_cache_filename(path)
+    version = os.stat(cache_filename).st_mtime_ns if os.path.exists(cache_filename) else None
+    return IMAGE_CACHE.get((path, version, max_size, height, size),
+                           lambda: resize_image(fetch_image(path), max_size, height, size))
+
+
+def open_image(filename, max_size=None, height=None, size=None):
+    """Локальная картинка (логотипы бота) через IMAGE_CACHE"""
+    version = os.stat(filename).st_mtime_ns
+    return IMAGE_CACHE.get((filename, version, max_size, height, size),
+                           lambda: resize_image(Image(filename=filename), max_size, height, size))
+
+
+async def prefetch_images(session, paths):
+    """
+    Заранее и параллельно скачивает недостающие картинки в кэш,
+    чтобы download_image в процессе рендера читал их только с диска.
+    Ошибки не поднимаются: ими займётся download_image, как и раньше.
+    """
+    missing = {path for path in paths if path and not os.path.exists(get_cache_filename(path))}
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+
+    async def fetch(path):
+        async with semaphore:
+            try:
+                async with session.get(f'{BASE_URL}/{path}') as r:
+                    if r.status != 200:
+                        return
+                    content = await r.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                return
+        write_cache_file(path, content)
+
+    await asyncio.gather(*(fetch(path) for path in missing))
+
+
+def background_images(data):
+    """Картинки, которые использует BasePreview.render_background"""
+    images = [data['background'], data['gow_logo'], data['kingdom_logo']]
+    if data.get('alternate_kingdom'):
+        images.append(data['alternate_kingdom_logo'])
+    return images
+
+
 def scale_down(width, height, max_size):
     ratio = width / height
     if width > height:
@@ -159,36 +262,10 @@ def scale_down(width, height, max_size):
         return round(ratio * max_size), max_size
 
 
+TEXT_LAYOUT = TextLayout()
+
+
 def word_wrap(image, draw, text, roi_width, roi_height):
     """Break long text to multiple lines, and reduce point size
     until all text fits within a bounding box."""
-    mutable_message = text
-    iteration_attempts = 100
-
-    def eval_metrics(txt):
-        """Quick helper function to calculate width/height of text."""
-        metrics = draw.get_font_metrics(image, txt, True)
-        return metrics.text_width, metrics.text_height
-
-    while draw.font_size > 0 and iteration_attempts:
-        iteration_attempts -= 1
-        width, height = eval_metrics(mutable_message)
-        if height > roi_height:
-            draw.font_size -= 0.75  # Reduce pointsize
-            mutable_message = text  # Restore original text
-        elif width > roi_width:
-            columns = len(mutable_message)
-            while columns > 0:
-                columns -= 1
-                mutable_message = '\n'.join(wrap(mutable_message, columns))
-                wrapped_width, _ = eval_metrics(mutable_message)
-                if wrapped_width <= roi_width:
-                    break
-            if columns < 1:
-                draw.font_size -= 0.75  # Reduce pointsize
-                mutable_message = text  # Restore original text
-        else:
-            break
-    if iteration_attempts < 1:
-        raise RuntimeError(f"Unable to calculate word_wrap for {text}")
-    return mutable_message
+    return TEXT_LAYOUT.word_wrap(image, draw, text, roi_width, roi_height)
@@ -4,8 +4,7 @@ from wand.color import Color
 from wand.drawing import Drawing
 
 from game_constants import CAMPAIGN_COLORS
-from graphic_base_preview import BasePreview, FONTS, download_image, scale_down, word_wrap
-from search import _
+from graphic_base_preview import BasePreview, FONTS, background_images, download_image, word_wrap
 
 
 class CampaignPreview(BasePreview):
@@ -21,8 +20,9 @@ class CampaignPreview(BasePreview):
         with Drawing() as draw:
             for category, tasks in self.data['campaigns'].items():
                 color = CAMPAIGN_COLORS[category]
-                skip_costs = f'{_("[SKIP_TASK]", self.data["lang"])}: {self.data["task_skip_costs"][category]} {_("[GEMS]", self.data["lang"])}'
-                title = f'{_(category, self.data["lang"])} ({skip_costs})'
+                texts = self.data['texts']
+                skip_costs = f'{texts["skip_task"]}: {self.data["task_skip_costs"][category]} {texts["gems"]}'
+                title = f'{texts[category]} ({skip_costs})'
 
                 box_height = 2 * base_font_size + (base_font_size + 5) * len(tasks) + 20
                 draw.fill_color = Color('black')
@@ -75,9 +75,7 @@ class CampaignPreview(BasePreview):
             draw.font_size = 25
             for i, item in enumerate(self.data['team']['troops']):
                 mana_url = f'emojis/{item["color_code"]}.png'
-                mana = download_image(mana_url)
-                mana_width, mana_height = scale_down(mana.width, mana.height, 30)
-                mana.resize(mana_width, mana_height)
+                mana = download_image(mana_url, max_size=30)
 
                 draw.composite(operator='atop',
                                left=x + 20, top=y + 80 + i * (mana.height + 15),
@@ -86,9 +84,8 @@ class CampaignPreview(BasePreview):
 
                 draw.text(x + 55, int(y + 80 + (i + 0.5) * (mana.height + 15)), item['name'])
             banner_filename = f'Banners/Banners_{self.data["team"]["banner"]["filename"]}_full.png'
-            banner = download_image(banner_filename)
-            banner_width, banner_height = scale_down(banner.width, banner.height, 120)
-            banner.resize(banner_width, banner_height)
+            banner = download_image(banner_filename, max_size=120)
+            banner_width, banner_height = banner.size
             banner_y = y + 80 + 4 * (mana.height + 15)
             draw.composite(operator='atop',
                            left=x + 20, top=banner_y,
@@ -124,6 +121,14 @@ class CampaignPreview(BasePreview):
         self.img.save(filename='test.png')
 
 
+def required_images(data):
+    images = background_images(data)
+    if data['team']:
+        images += [f'emojis/{troop["color_code"]}.png' for troop in data['team']['troops']]
+        images.append(f'Banners/Banners_{data["team"]["banner"]["filename"]}_full.png')
+    return images
+
+
 def render_all(result):
     overview = CampaignPreview(result)
     overview.render_background('{0[texts][campaign]} {0[week]}, {0[date]}')
@@ -1,10 +1,14 @@
+import glob
+import hashlib
 import io
+import os
 
 import requests.exceptions
 from wand.color import Color
 from wand.drawing import Drawing
 
-from graphic_base_preview import BasePreview, FONTS, download_image
+from graphic_base_preview import BasePreview, FONTS, download_image, fetch_image, get_cache_filename, open_image, \
+    resize_image, write_cache_file
 
 
 def clamp01(value):
@@ -22,16 +26,47 @@ class WorldMap(BasePreview):
         super().__init__(data)
         self.img = None
 
-    def render_map(self):
-        self.img = download_image(self.data['water'])
-        self.img.alpha_channel = True
-        self.img.resize(self.SIZE, self.SIZE)
-        world_map = download_image(self.data['map'])
-        world_map.resize(self.SIZE, self.SIZE)
+    def get_base_layer_path(self):
+        """Имя готовой подложки зависит от карты и версий её текстур"""
+        sources = [self.data['water'], self.data['map'], self.data['height']]
+        versions = [
+            str(os.stat(get_cache_filename(path)).st_mtime_ns) if os.path.exists(get_cache_filename(path)) else ''
+            for path in sources
+        ]
+        digest = hashlib.sha256('|'.join(sources + versions + [self.data['blend_mode']]).encode()).hexdigest()[:16]
+        location = os.path.splitext(os.path.basename(self.data['map']))[0]
+        return f'Worldmap/base/{location}_{self.SIZE}_{digest}.png'
+
+    def render_base_layer(self):
+        """
+        Подложка карты: вода, рельеф, текстура и полосы под заголовок и подпись.
+        Считается один раз на карту и версию текстур, дальше берётся из кэша.
+        """
+        base_layer_path = self.get_base_layer_path()
+        base_layer_filename = get_cache_filename(base_layer_path)
+        try:
+            self.img = open_image(base_layer_filename)
+            return
+        except FileNotFoundError:
+            pass
+        self.render_map()
+        self.render_overlay_bars()
+        write_cache_file(base_layer_path, self.img.make_blob('png'))
+        prefix = base_layer_path.rsplit('_', 1)[0]
+        for outdated in glob.glob(get_cache_filename(f'{prefix}_*.png')):
+            if outdated == base_layer_filename:
+                continue
+            try:
+                os.remove(outdated)
+            except FileNotFoundError:
+                pass
 
-        height = download_image(self.data['height'])
-        height.alpha_channel = True
-        height.resize(self.SIZE, self.SIZE)
+    def render_map(self):
+        # исходные текстуры нужны только для подложки, поэтому мимо IMAGE_CACHE
+        size = self.SIZE, self.SIZE
+        self.img = resize_image(fetch_image(self.data['water']), size=size)
+        world_map = resize_image(fetch_image(self.data['map']), size=size)
+        height = resize_image(fetch_image(self.data['height']), size=size)
 
         with Drawing() as draw:
             draw.composite(operator='overlay',
@@ -43,12 +78,16 @@ class WorldMap(BasePreview):
                            width=self.SIZE, height=self.SIZE, image=world_map)
             draw(self.img)
 
-    def render_overlays(self):
+    def render_overlay_bars(self):
         with Drawing() as draw:
             color = Color('rgba(0, 0, 0, 0.7)')
             draw.fill_color = color
             draw.rectangle(0, 0, self.SIZE, 200)
             draw.rectangle(0, self.SIZE - 100, self.SIZE, self.SIZE)
+            draw(self.img)
+
+    def render_overlays(self):
+        with Drawing() as draw:
             draw.fill_color = Color('white')
             draw.font_size = 100
             draw.text_antialias = True
@@ -94,9 +133,15 @@ class WorldMap(BasePreview):
             draw(self.img)
 
 
+def required_images(data):
+    return [data['water'], data['map'], data['height']] + [
+        f'Troopcardshields_{kingdom["filename"]}_full.png' for kingdom in data['kingdoms']
+    ]
+
+
 def render_all(result):
     world_map = WorldMap(result)
-    world_map.render_map()
+    world_map.render_base_layer()
     world_map.render_overlays()
     world_map.render_kingdoms()
     world_map.draw_watermark()
@@ -0,0 +1,210 @@
+import asyncio
+import glob
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from configurations import CONFIG
+from graphic_base_preview import get_cache_filename, prefetch_images
+
+log = logging.getLogger(__name__)
+
+RENDER_SOURCES = [
+    'graphic_base_preview.py',
+    'graphic_campaign_preview.py',
+    'graphic_map.py',
+    'graphic_soulforge_preview.py',
+    'text_layout.py',
+    'switch_logo.png',
+    'gary.png',
+]
+
+
+def get_render_version():
+    """Хэш кода рендера, шрифтов и локальных картинок: после деплоя с изменениями старые png уже не подходят"""
+    digest = hashlib.sha256()
+    for filename in RENDER_SOURCES + sorted(glob.glob('fonts/*')):
+        try:
+            with open(filename, 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            continue
+        digest.update(filename.encode())
+        digest.update(content)
+    return digest.hexdigest()
+
+
+def freeze(value):
+    """Приводит данные рендера к виду, у которого json не зависит от порядка ключей и элементов множеств"""
+    if isinstance(value, dict):
+        return sorted((str(k), freeze(v)) for k, v in value.items())
+    if isinstance(value, (set, frozenset)):
+        return sorted((freeze(v) for v in value), key=repr)
+    if isinstance(value, (list, tuple)):
+        return [freeze(v) for v in value]
+    return value
+
+
+class RenderCache:
+    """
+    Дисковый LRU-кэш готовых png по хэшу входных данных и использованных картинок.
+    Общий размер ограничен render_cache_max_mb, давно не использованные файлы удаляются первыми.
+    """
+
+    def __init__(self, path=None, max_bytes=None):
+        self.path = path or CONFIG.get('render_cache_path', '.render_cache')
+        self.max_bytes = max_bytes or CONFIG.get('render_cache_max_mb', 200) * 1024 * 1024
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.version = get_render_version()
+        self.load()
+
+    def load(self):
+        os.makedirs(self.path, exist_ok=True)
+        files = [entry for entry in os.scandir(self.path) if entry.name.endswith('.png')]
+        for entry in sorted(files, key=lambda e: e.stat().st_mtime):
+            self.entries[entry.name.removesuffix('.png')] = entry.stat().st_size
+
+    def make_key(self, module, data, images):
+        """
+        Ключ включает версию кода рендера, поэтому картинки от прошлых версий просто вытесняются.
+        :param module: модуль рендера
+        :param data: данные для module.render_all
+        :param images: картинки из module.required_images, их изменение в кэше ассетов меняет ключ
+        :return: sha256 в hex
+        """
+        assets = []
+        for path in sorted(set(filter(None, images))):
+            try:
+                stat = os.stat(get_cache_filename(path))
+                assets.append((path, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                assets.append((path, None, None))
+        payload = json.dumps([self.version, module.__name__, freeze(data), assets], default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get_filename(self, key):
+        return os.path.join(self.path, f'{key}.png')
+
+    def get(self, key):
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        filename = self.get_filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                content = f.read()
+            os.utime(filename)
+        except OSError:
+            del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return io.BytesIO(content)
+
+    def put(self, key, image_data):
+        content = image_data.getvalue()
+        filename = self.get_filename(key)
+        temp_filename = f'{filename}.tmp'
+        with open(temp_filename, 'wb') as f:
+            f.write(content)
+        os.replace(temp_filename, filename)
+        self.entries[key] = len(content)
+        self.entries.move_to_end(key)
+        self.evict()
+
+    def evict(self):
+        total = sum(self.entries.values())
+        while total > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            total -= size
+            self.remove(key)
+
+    def remove(self, key):
+        try:
+            os.remove(self.get_filename(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for key in self.entries:
+            self.remove(key)
+        self.entries.clear()
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'bytes': sum(self.entries.values()),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / requests if requests else 0.0,
+        }
+
+
+class Renderer:
+    """
+    Рендерит картинки (карта, кампания, соулфорж) в отдельных процессах, не блокируя цикл событий.
+    Перед рендером все нужные картинки параллельно скачиваются в кэш через общую http-сессию.
+    Модуль рендера должен предоставлять required_images(data) и render_all(data).
+    Готовые картинки кэшируются в RenderCache.
+    """
+
+    def __init__(self, processes=None, cache=None):
+        self.processes = processes or CONFIG.get('render_processes', 2)
+        self.pool = None
+        self.cache = cache or RenderCache()
+        self.pending = {}
+
+    def get_pool(self):
+        if self.pool is None:
+            # forkserver: дочерние процессы не наследуют потоки и соединения бота
+            context = multiprocessing.get_context('forkserver')
+            self.pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=context)
+        return self.pool
+
+    async def render(self, module, data, session):
+        """
+        :param module: graphic_map, graphic_campaign_preview или graphic_soulforge_preview
+        :param data: данные для module.render_all
+        :param session: aiohttp.ClientSession для скачивания картинок
+        :return: io.BytesIO с png
+        """
+        images = module.required_images(data)
+        await prefetch_images(session, images)
+        key = self.cache.make_key(module, data, images)
+        if image_data := self.cache.get(key):
+            return image_data
+        # одинаковые запросы во время рендера ждут один и тот же результат
+        if key not in self.pending:
+            self.pending[key] = asyncio.ensure_future(self.render_uncached(module, data, key))
+            self.pending[key].add_done_callback(lambda _: self.pending.pop(key, None))
+        image_data = await asyncio.shield(self.pending[key])
+        return io.BytesIO(image_data.getvalue())
+
+    async def render_uncached(self, module, data, key):
+        loop = asyncio.get_running_loop()
+        try:
+            image_data = await loop.run_in_executor(self.get_pool(), module.render_all, data)
+        except BrokenProcessPool:
+            log.error(f'Render process for {module.__name__} died, restarting the pool.')
+            self.close()
+            raise
+        try:
+            self.cache.put(key, image_data)
+        except OSError as e:
+            log.warning(f'Could not store {module.__name__} render in cache: {e}')
+        return image_data
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
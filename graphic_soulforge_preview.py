@@ -5,7 +5,7 @@ from typing import Mapping
 from wand.color import Color
 from wand.drawing import Drawing
 
-from graphic_base_preview import BasePreview, FONTS, download_image, scale_down, word_wrap
+from graphic_base_preview import BasePreview, FONTS, background_images, download_image, scale_down, word_wrap
 
 LESSER_DARK_GRAY = Color('rgb(35, 39, 38)')
 DARK_GRAY = Color('rgba(0, 0, 0, 0.7)')
@@ -35,9 +35,7 @@ class WeeklyPreview(BasePreview):
     def render_soulforge_screen(self):
         left, top, width, height = self.get_box_coordinates(1)
 
-        self.weapon = download_image(self.data['filename'])
-        ratio = self.weapon.width / self.weapon.height
-        self.weapon.resize(round(180 * ratio), 180)
+        self.weapon = download_image(self.data['filename'], height=180)
         with Drawing() as draw:
             draw.fill_color = Color('none')
             draw.stroke_color = Color('rgb(16, 17, 19)')
@@ -204,9 +202,7 @@ class WeeklyPreview(BasePreview):
             icon_top = round(height - 70)
             for i, (stat, increase) in enumerate(self.data['stat_increases'].items()):
                 icon_left = left + margin + i * (box_width + distance)
-                stat_icon = download_image(self.data['stat_icon'].format(stat=stat))
-                width, height = scale_down(*stat_icon.size, max_size=50)
-                stat_icon.resize(width=width, height=height)
+                stat_icon = download_image(self.data['stat_icon'].format(stat=stat), max_size=50)
                 draw.text(icon_left + 70, top + icon_top + int(1.1 * draw.font_size), str(increase))
                 draw.composite(operator='atop',
                                left=icon_left, top=top + icon_top,
@@ -239,9 +235,8 @@ class WeeklyPreview(BasePreview):
             draw.font_size = 30
             draw.font = FONTS['raleway']
             for jewel in self.data['requirements']['jewels']:
-                jewel_icon = download_image(jewel['filename'])
-                jewel_width, jewel_height = scale_down(jewel_icon.width, jewel_icon.height, 50)
-                jewel_icon.resize(width=jewel_width, height=jewel_height)
+                jewel_icon = download_image(jewel['filename'], max_size=50)
+                jewel_width, jewel_height = jewel_icon.size
                 draw.composite(operator='atop',
                                left=left + 25, top=top + offset + round(1.5 * draw.font_size),
                                width=jewel_width, height=jewel_height,
@@ -285,6 +280,15 @@ class WeeklyPreview(BasePreview):
         return result
 
 
+def required_images(data):
+    requirements = [r[0] for r in WeeklyPreview(data).extract_requirements() if r]
+    return background_images(data) + requirements + [
+        data['filename'], data['affix_icon'], data['gold_medal'], data['mana_color'],
+    ] + [data['stat_icon'].format(stat=stat) for stat in data['stat_increases']] + [
+        jewel['filename'] for jewel in data['requirements']['jewels']
+    ]
+
+
 def render_all(result):
     overview = WeeklyPreview(result)
     overview.render_background('{0[texts][soulforge]}: {0[date]}')
@@ -0,0 +1,82 @@
+"""
+Job code for distributing news articles to subscribed channels
+"""
+import asyncio
+import statistics
+import time
+
+import discord
+
+from base_bot import log
+from configurations import CONFIG
+
+
+class NewsDispatcher:
+    """
+    Sends news to many channels concurrently.
+    Each channel gets its embeds in order, at most `concurrency` channels are served at once,
+    failed sends are retried with exponential backoff, rate limits are waited out.
+    """
+
+    def __init__(self, concurrency=None, max_attempts=None, backoff_seconds=None):
+        self.concurrency = concurrency or CONFIG.get('news_fanout_concurrency', 20)
+        self.max_attempts = max_attempts or CONFIG.get('news_fanout_attempts', 3)
+        self.backoff_seconds = backoff_seconds or CONFIG.get('news_fanout_backoff_seconds', 2)
+        self.latencies = []
+        self.failures = 0
+
+    async def send_all(self, deliveries):
+        """
+        :param deliveries: dict channel -> list of embeds
+        """
+        started = time.monotonic()
+        self.latencies = []
+        self.failures = 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(self.send_to_channel(channel, embeds, semaphore)
+                               for channel, embeds in deliveries.items()))
+        if deliveries:
+            log.info(f'News sent to {len(deliveries)} channels in {time.monotonic() - started:.1f}s, '
+                     f'{self.get_latency_summary()}, {self.failures} failed.')
+
+    async def send_to_channel(self, channel, embeds, semaphore):
+        async with semaphore:
+            for e in embeds:
+                if not await self.send_with_retry(channel, e):
+                    self.failures += 1
+
+    async def send_with_retry(self, channel, embed):
+        for attempt in range(1, self.max_attempts + 1):
+            started = time.monotonic()
+            try:
+                await channel.send(embed=embed)
+                self.latencies.append(time.monotonic() - started)
+                return True
+            except discord.RateLimited as ex:
+                delay = ex.retry_after
+            except (discord.Forbidden, discord.NotFound) as ex:
+                log.warning(f'Could not send out news to "{channel}": {ex}')
+                return False
+            except discord.HTTPException as ex:
+                if ex.status != 429 and ex.status < 500:
+                    log.error(f'Could not send out news to "{channel}", exception follows')
+                    log.exception(ex)
+                    return False
+                delay = self.backoff_seconds * 2 ** (attempt - 1)
+            except discord.DiscordException as ex:
+                log.error(f'Could not send out news to "{channel}", exception follows')
+                log.exception(ex)
+                return False
+            if attempt < self.max_attempts:
+                log.debug(f'Retrying news for "{channel}" in {delay:.1f}s (attempt {attempt}/{self.max_attempts}).')
+                await asyncio.sleep(delay)
+        log.error(f'Giving up sending news to "{channel}" after {self.max_attempts} attempts.')
+        return False
+
+    def get_latency_summary(self):
+        if not self.latencies:
+            return 'no deliveries'
+        latencies = sorted(self.latencies)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return f'latency median {statistics.median(latencies) * 1000:.0f}ms, ' \
+               f'p95 {p95 * 1000:.0f}ms, max {latencies[-1] * 1000:.0f}ms'
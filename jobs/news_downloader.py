@@ -13,7 +13,7 @@ from io import BytesIO
 import aiohttp
 import feedparser
 import html2markdown
-from PIL import Image
+from PIL import ImageFile
 from bs4 import BeautifulSoup
 
 from base_bot import log
@@ -30,13 +30,61 @@ class NewsDownloader:
     POSTS_CONTENTS_FILENAME = 'jobs/posts.json'
     NEWS_FILENAME = 'jobs/posts.json'
     GOW_FEED_URL = 'https://gemsofwar.com/feed/'
+    IMAGE_RATIOS_FILENAME = 'jobs/image_ratios.json'
+    FEED_VALIDATORS_FILENAME = 'jobs/feed_validators.json'
     HEADERS = {'user-agent': 'garyatrics.com Discord Bot'}
     REQUEST_TIMEOUT = 10
+    MAX_CONCURRENT_PROBES = 5
+    MAX_CACHED_IMAGES = 2000
+    HEADER_CHUNK_SIZE = 4096
+    MAX_HEADER_BYTES = 512 * 1024
 
     def __init__(self, session):
         self.last_post_date = datetime.datetime.min
         self.get_last_post_date()
+        self.feed_validators = {}
+        self.load_feed_validators()
         self.session = session
+        self.image_ratios = {}
+        self.image_ratios_changed = False
+        self.load_image_ratios()
+        self.probe_semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_PROBES)
+
+    def load_image_ratios(self) -> None:
+        """
+        loads the width/height ratios of images probed during earlier polls
+        :return: None
+        """
+        if os.path.exists(self.IMAGE_RATIOS_FILENAME):
+            with open(self.IMAGE_RATIOS_FILENAME, encoding="utf-8") as ratios_file:
+                self.image_ratios = json.load(ratios_file)
+
+    def save_image_ratios(self) -> None:
+        if not self.image_ratios_changed:
+            return
+        ratios = list(self.image_ratios.items())[-self.MAX_CACHED_IMAGES:]
+        with open(self.IMAGE_RATIOS_FILENAME, 'w', encoding="utf-8") as ratios_file:
+            json.dump(dict(ratios), ratios_file)
+        self.image_ratios_changed = False
+
+    async def get_image_size(self, source: str):
+        """
+        Reads only as many bytes as PIL needs to know the image dimensions
+        :param source: image url
+        :return: (width, height) or None if the header could not be parsed
+        """
+        parser = ImageFile.Parser()
+        received = 0
+        async with self.probe_semaphore:
+            async with self.session.get(source, timeout=self.REQUEST_TIMEOUT, headers=self.HEADERS) as r:
+                async for chunk in r.content.iter_chunked(self.HEADER_CHUNK_SIZE):
+                    parser.feed(chunk)
+                    if parser.image:
+                        return parser.image.size
+                    received += len(chunk)
+                    if received >= self.MAX_HEADER_BYTES:
+                        break
+        return None
 
     async def is_banner(self, source: str) -> bool:
         """
@@ -46,16 +94,23 @@ class NewsDownloader:
         """
         if "dividerline" in source or "ForumBanner" in source:
             return True
+        arbitrary_ratio_limit_for_banners = 5
+        if source in self.image_ratios:
+            return self.image_ratios[source] >= arbitrary_ratio_limit_for_banners
         try:
-            async with self.session.get(source, timeout=self.REQUEST_TIMEOUT, headers=self.HEADERS) as r:
-                image = Image.open(BytesIO(await r.read()))
+            size = await self.get_image_size(source)
         except asyncio.TimeoutError:
             log.error('[NEWS] Timeout while fetching %s', source)
             return False
-        await asyncio.sleep(5)
-        size = image.size
+        except (aiohttp.ClientError, OSError) as e:
+            log.error('[NEWS] Could not probe %s: %s', source, e)
+            return False
+        if not size or not size[1]:
+            log.warning('[NEWS] Could not read image dimensions of %s.', source)
+            return False
         ratio = size[0] / size[1]
-        arbitrary_ratio_limit_for_banners = 5
+        self.image_ratios[source] = ratio
+        self.image_ratios_changed = True
         log.debug('[NEWS] Found a ratio of %s in %s.', ratio, source)
         return ratio >= arbitrary_ratio_limit_for_banners
 
@@ -66,12 +121,9 @@ class NewsDownloader:
         :return: list of image urls and content text
         """
         soup = BeautifulSoup(text, 'html5lib')
-        source_images = soup.findAll('img')
-        images = []
-        for i in source_images:
-            source = i['src']
-            if source and not await self.is_banner(source):
-                images.append(source)
+        sources = [i['src'] for i in soup.findAll('img') if i.get('src')]
+        banners = await asyncio.gather(*(self.is_banner(source) for source in sources))
+        images = [source for source, banner in zip(sources, banners) if not banner]
 
         forbidden_tags = re.compile(r'</?(a|img|div|figure|em)[^>]*>')
         tags_removed = re.sub(forbidden_tags, '', text).replace('\n', '')
@@ -96,6 +148,30 @@ class NewsDownloader:
             with open(self.LAST_POST_DATE_FILENAME, encoding="utf-8") as date_file:
                 self.last_post_date = datetime.datetime.fromisoformat(date_file.read().strip())
 
+    def load_feed_validators(self) -> None:
+        """
+        loads ETag and Last-Modified of the last feed response, for conditional requests
+        :return: None
+        """
+        if os.path.exists(self.FEED_VALIDATORS_FILENAME):
+            with open(self.FEED_VALIDATORS_FILENAME, encoding="utf-8") as validators_file:
+                self.feed_validators = json.load(validators_file)
+
+    def save_feed_validators(self, validators: dict) -> None:
+        if validators == self.feed_validators:
+            return
+        self.feed_validators = validators
+        with open(self.FEED_VALIDATORS_FILENAME, 'w', encoding="utf-8") as validators_file:
+            json.dump(validators, validators_file)
+
+    def get_conditional_headers(self) -> dict:
+        headers = self.HEADERS.copy()
+        if etag := self.feed_validators.get('etag'):
+            headers['If-None-Match'] = etag
+        if last_modified := self.feed_validators.get('last_modified'):
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
     async def process_news_feed(self) -> None:
         """
         fetches the feed, goes through every entry and converts it into
@@ -103,24 +179,42 @@ class NewsDownloader:
         the posts file.
         :return: None
         """
-        url = f'{self.GOW_FEED_URL}?{int(time.time())}'
+        url = self.GOW_FEED_URL
         try:
-            async with self.session.get(url, timeout=5, headers=self.HEADERS) as r:
+            async with self.session.get(url, timeout=5, headers=self.get_conditional_headers()) as r:
+                if r.status == 304:
+                    log.debug('[NEWS] Feed is unchanged.')
+                    return
+                r.raise_for_status()
                 content = BytesIO(await r.read())
+                validators = {
+                    'etag': r.headers.get('ETag'),
+                    'last_modified': r.headers.get('Last-Modified'),
+                }
         except aiohttp.ClientError as e:
             log.warn(f'Could not fetch {url}: {e}')
             return
 
         feed = feedparser.parse(content)
+        if feed.bozo and not feed['entries']:
+            log.warning(f'[NEWS] Could not parse {url}: {feed.get("bozo_exception")}')
+            return
         new_last_post_date = self.last_post_date
 
+        dated_entries = [entry for entry in feed['entries'] if entry.get('published_parsed')]
+        complete = len(dated_entries) == len(feed['entries'])
+        if not complete:
+            log.warning(f'[NEWS] Skipped {len(feed["entries"]) - len(dated_entries)} feed entries without a date.')
+
         posts = []
-        for entry in feed['entries']:
+        # Порядок ленты не гарантирован, поэтому сортируем от новых к старым сами
+        for entry in sorted(dated_entries, key=lambda e: e.published_parsed, reverse=True):
             platform = 'switch' if 'switch' in entry.title.lower() else 'pc'
 
             posted_date = datetime.datetime.fromtimestamp(time.mktime(entry.published_parsed))
             if posted_date <= self.last_post_date:
-                continue
+                # дальше только уже известные посты
+                break
 
             images, content = await self.reformat_html_summary(entry)
             posts.append({
@@ -132,6 +226,7 @@ class NewsDownloader:
                 'platform': platform,
             })
             new_last_post_date = max(new_last_post_date, posted_date)
+        self.save_image_ratios()
 
         if posts:
             with open(self.POSTS_CONTENTS_FILENAME, 'w', encoding="utf-8") as posts_file:
@@ -139,3 +234,7 @@ class NewsDownloader:
 
             with open(self.LAST_POST_DATE_FILENAME, 'w', encoding="utf-8") as date_file:
                 date_file.write(new_last_post_date.isoformat())
+        # Валидаторы запоминаются только после полностью обработанной ленты,
+        # иначе следующий запрос получит 304 и пропущенные посты уже не будут повторены
+        if complete:
+            self.save_feed_validators(validators)
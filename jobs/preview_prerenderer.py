@@ -0,0 +1,68 @@
+"""
+Job code for rendering weekly preview images ahead of time
+"""
+import asyncio
+import time
+
+import graphic_campaign_preview
+import graphic_soulforge_preview
+import translations
+from base_bot import log
+from configurations import CONFIG
+
+
+class PreviewPrerenderer:
+    """
+    Renders campaign and soulforge previews for every loaded language into the render cache,
+    so that the owner commands for the same week are answered from the cache.
+    Other languages fall back to English texts and share its images, so they are not rendered separately.
+    """
+    TRIGGER_FILES = {'World.json', 'Campaign.json', 'Soulforge.json'}
+
+    def __init__(self, languages=None):
+        self.languages = languages
+        self.switch = CONFIG.get('default_news_platform') == 'switch'
+
+    def is_triggered_by(self, modified_files):
+        return bool(self.TRIGGER_FILES.intersection(modified_files))
+
+    def get_languages(self):
+        """
+        :return: the requested languages, or the ones with loaded translations
+        """
+        if self.languages:
+            return self.languages
+        loaded = translations._instance.all_translations
+        return [lang for lang in translations.LANGUAGES if lang in loaded]
+
+    def get_jobs(self, discord_client, lang):
+        """
+        :param discord_client: the bot, its expander provides the render data
+        :param lang: language code
+        :return: list of (render module, render data), built the same way as by the owner commands
+        """
+        jobs = [(graphic_campaign_preview, discord_client.get_campaign_preview_data(lang, self.switch))]
+        for weapon_id in discord_client.expander.get_upcoming_soulforge_weapon_ids():
+            weapon_data = discord_client.expander.get_soulforge_weapon_image_data(str(weapon_id), None,
+                                                                                  self.switch, lang)
+            if weapon_data:
+                jobs.append((graphic_soulforge_preview, weapon_data))
+        return jobs
+
+    async def run(self, discord_client):
+        """
+        :param discord_client: the bot, its renderer spreads the work over the process pool
+        """
+        if not CONFIG.get('prerender_previews', True):
+            return
+        started = time.monotonic()
+        languages = self.get_languages()
+        jobs = [job for lang in languages for job in self.get_jobs(discord_client, lang)]
+        results = await asyncio.gather(
+            *(discord_client.renderer.render(module, data, discord_client.session) for module, data in jobs),
+            return_exceptions=True)
+        failures = [r for r in results if isinstance(r, Exception)]
+        for ex in failures:
+            log.error('Could not pre-render a preview image, exception follows', exc_info=ex)
+        log.info(f'Pre-rendered {len(jobs) - len(failures)} of {len(jobs)} preview images '
+                 f'for {len(languages)} languages in {time.monotonic() - started:.1f}s.')
@@ -1,7 +1,5 @@
 import time
 
-import aiohttp
-
 from configurations import CONFIG
 
 
@@ -15,10 +13,9 @@ class StatusReporter:
     async def update(self, discord_client):
         if not CONFIG.get("statuspage_api_key"):
             return
-        self.session = aiohttp.ClientSession(raise_for_status=True)
+        self.session = discord_client.session
         await self.update_status(discord_client)
         await self.update_metric(discord_client)
-        await self.session.close()
 
     async def update_status(self, discord_client):
         page_id = CONFIG.get("statuspage_page_id")
@@ -37,7 +34,8 @@ class StatusReporter:
             status = "degraded_performance"
         component = {"component": {"status": status}}
 
-        async with self.session.patch(url, headers=headers, json=component):
+        async with self.session.patch(url, headers=headers, json=component, raise_for_status=True,
+                                      timeout=discord_client.api_timeout()):
             pass
 
     async def update_metric(self, discord_client):
@@ -57,5 +55,6 @@ class StatusReporter:
                 }]
             }
         }
-        async with self.session.post(url, headers=headers, json=payload):
+        async with self.session.post(url, headers=headers, json=payload, raise_for_status=True,
+                                     timeout=discord_client.api_timeout()):
             pass
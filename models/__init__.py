@@ -1,5 +1,5 @@
 from models.base_json_storage import BaseGuildStorage
-from models.db import DB
+from models.db import AsyncDB, DB, RecordCache, WriteBehindQueue
 from models.language import Language
 from models.prefix import Prefix
 from models.subscriptions import Subscriptions
@@ -1,21 +1,16 @@
 import datetime
 
-from models import DB
+from models import AsyncDB
 
 
 class Ban:
     @staticmethod
-    def get(guild_id):
-        db = DB()
-        result = db.cursor.execute('SELECT * FROM Ban WHERE guild_id = ?;', (guild_id,))
-        ban = result.fetchone()
-        db.close()
-        return ban
+    async def get(guild_id):
+        return await AsyncDB.get().fetchone('SELECT * FROM Ban WHERE guild_id = ?;', (guild_id,))
 
     @staticmethod
-    def add(guild_id, reason, author_name):
-        db = DB()
-        db.cursor.execute(
+    async def add(guild_id, reason, author_name):
+        await AsyncDB.get().execute(
             'REPLACE INTO Ban (guild_id, reason, author_name, ban_time)'
             'VALUES (?, ?, ?, ?)',
             (guild_id,
@@ -23,5 +18,3 @@ class Ban:
              author_name,
              datetime.datetime.utcnow(),
              ))
-        db.commit()
-        db.close()
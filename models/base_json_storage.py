@@ -1,6 +1,8 @@
+import functools
 import json
 import os
-import threading
+
+from models.db import WriteBehindQueue
 
 
 class BaseGuildStorage:
@@ -14,20 +16,18 @@ class BaseGuildStorage:
     def load(self):
         if not os.path.exists(self.FILENAME):
             return
-        lock = threading.Lock()
-        with lock:
-            with open(self.FILENAME) as f:
-                self.__data = json.load(f)
+        with open(self.FILENAME) as f:
+            self.__data = json.load(f)
 
-    def save(self):
-        lock = threading.Lock()
-        with lock:
-            with open(self.FILENAME, 'w') as f:
-                json.dump(self.__data, f, sort_keys=True, indent=2)
+    def save(self, data=None):
+        with open(self.FILENAME, 'w') as f:
+            json.dump(self.__data if data is None else data, f, sort_keys=True, indent=2)
 
     def set(self, guild, value):
         self.__data[str(guild.id)] = value
-        self.save()
+        # запись идёт в потоке базы, поэтому ей передаётся копия, а не изменяемый словарь
+        save = functools.partial(self.save, dict(self.__data))
+        WriteBehindQueue.get().save_later(self.FILENAME, save)
 
     def get(self, guild):
         if guild is None:
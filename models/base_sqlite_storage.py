@@ -1,6 +1,4 @@
-import asyncio
-
-from models.db import DB
+from models.db import DB, WriteBehindQueue
 
 
 class BaseGuildStorage:
@@ -18,18 +16,13 @@ class BaseGuildStorage:
 
     async def set(self, guild, value):
         self.__data[guild.id] = value
-        lock = asyncio.Lock()
-        async with lock:
-            db = DB()
-            query = f"""
-            INSERT INTO {self.table} (guild_id, value)
-              VALUES (?, ?)
-              ON CONFLICT (guild_id)
-              DO UPDATE SET value=?;
-            """
-            db.cursor.execute(query, (guild.id, value, value))
-            db.commit()
-            db.close()
+        query = f"""
+        INSERT INTO {self.table} (guild_id, value)
+          VALUES (?, ?)
+          ON CONFLICT (guild_id)
+          DO UPDATE SET value=?;
+        """
+        WriteBehindQueue.get().put(query, (guild.id, value, value), key=(self.table, guild.id))
 
     def get(self, guild):
         if guild is None:
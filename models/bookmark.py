@@ -1,9 +1,10 @@
-import asyncio
 import datetime
+import itertools
 
 from hashids import Hashids
 
-from models import DB
+from configurations import CONFIG
+from models import AsyncDB, RecordCache
 
 MAX_BOOKMARKS = 30
 
@@ -13,36 +14,44 @@ class BookmarkError(Exception):
 
 
 class Bookmark:
+    """
+    Закладки не загружаются целиком: записи читаются из базы по id или по автору
+    и держатся в ограниченном LRU-кэше.
+    """
+
     def __init__(self):
-        self.bookmarks = {}
-        self.load()
-
-    def load(self):
-        db = DB()
-        result = db.cursor.execute('SELECT * FROM Bookmark;')
-        bookmarks = result.fetchall()
-        self.bookmarks = {
-            b['id']: {
-                'id': b['id'],
-                'author_id': b['author_id'],
-                'author_name': b['author_name'],
-                'description': b['description'],
-                'team_code': b['team_code'],
-                'created': b['created'],
-            }
-            for b in bookmarks
+        cache_size = CONFIG.get('user_data_cache_size', 1000)
+        self.bookmarks = RecordCache(cache_size)
+        self.by_author = RecordCache(cache_size)
+        self.id_counter = None
+
+    @staticmethod
+    def from_row(b):
+        return {
+            'id': b['id'],
+            'author_id': b['author_id'],
+            'author_name': b['author_name'],
+            'description': b['description'],
+            'team_code': b['team_code'],
+            'created': b['created'],
         }
-        db.close()
 
-    def get(self, bookmark_id):
-        return self.bookmarks.get(bookmark_id)
+    async def get(self, bookmark_id):
+        if bookmark_id in self.bookmarks:
+            return self.bookmarks.get(bookmark_id)
+        row = await AsyncDB.get().fetchone('SELECT * FROM Bookmark WHERE id = ?;', (bookmark_id,))
+        if row is None:
+            return None
+        bookmark = self.from_row(row)
+        self.bookmarks.put(bookmark_id, bookmark)
+        return bookmark
 
     async def add(self, author_id, author_name, description, team_code):
-        if len(self.get_my_bookmarks(author_id)) >= MAX_BOOKMARKS:
+        if len(await self.get_my_bookmarks(author_id)) >= MAX_BOOKMARKS:
             raise BookmarkError(f'You have reached the maximum amount of {MAX_BOOKMARKS} bookmarks.'
                                 f' Please consider deleting some using `!bookmark delete <id>`.')
 
-        _id = self.generate_new_id(author_name)
+        _id = await self.generate_new_id(author_name)
         bookmark = {
             'id': _id,
             'author_id': str(author_id),
@@ -51,50 +60,48 @@ class Bookmark:
             'team_code': team_code,
             'created': datetime.datetime.utcnow(),
         }
-        lock = asyncio.Lock()
-        async with lock:
-            self.bookmarks[_id] = bookmark
-            db = DB()
-            db.cursor.execute(
-                'REPLACE INTO Bookmark (id, author_id, author_name, description, team_code) '
-                'VALUES (?, ?, ?, ?, ?)',
-                (_id,
-                 author_id,
-                 author_name,
-                 description,
-                 team_code,
-                 ))
-            db.commit()
-            db.close()
+        self.bookmarks.put(_id, bookmark)
+        if (my_bookmarks := self.by_author.get(bookmark['author_id'])) is not None:
+            my_bookmarks[_id] = bookmark
+        await AsyncDB.get().execute(
+            'REPLACE INTO Bookmark (id, author_id, author_name, description, team_code) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (_id,
+             author_id,
+             author_name,
+             description,
+             team_code,
+             ))
         return _id
 
     async def remove(self, author_id, bookmark_id):
-        if bookmark_id not in self.bookmarks:
+        bookmark = await self.get(bookmark_id)
+        if not bookmark:
             raise BookmarkError('The bookmark you are trying to delete does not exist.')
-        elif str(author_id) != self.bookmarks[bookmark_id]['author_id']:
+        elif str(author_id) != bookmark['author_id']:
             raise BookmarkError('The bookmark you are trying to delete belongs to someone else.')
-        lock = asyncio.Lock()
-        async with lock:
-            db = DB()
-            db.cursor.execute('DELETE FROM Bookmark WHERE id = ?', (bookmark_id,))
-            db.commit()
-            db.close()
-            del (self.bookmarks[bookmark_id])
-
-    def get_my_bookmarks(self, author_id):
-        return [t for t in self.bookmarks.values() if str(author_id) == t['author_id']]
-
-    def __len__(self):
-        return len(self.bookmarks)
-
-    def __iter__(self):
-        yield from self.bookmarks.values()
-
-    def generate_new_id(self, author_name):
+        self.bookmarks.pop(bookmark_id)
+        if (my_bookmarks := self.by_author.get(bookmark['author_id'])) is not None:
+            my_bookmarks.pop(bookmark_id, None)
+        await AsyncDB.get().execute('DELETE FROM Bookmark WHERE id = ?', (bookmark_id,))
+
+    async def get_my_bookmarks(self, author_id):
+        author_id = str(author_id)
+        if author_id not in self.by_author:
+            rows = await AsyncDB.get().fetchall('SELECT * FROM Bookmark WHERE author_id = ? ORDER BY rowid;',
+                                                (author_id,))
+            self.by_author.put(author_id, {row['id']: self.from_row(row) for row in rows})
+        return list(self.by_author.get(author_id).values())
+
+    async def count(self):
+        row = await AsyncDB.get().fetchone('SELECT COUNT(*) FROM Bookmark;')
+        return row[0]
+
+    async def generate_new_id(self, author_name):
+        if self.id_counter is None:
+            self.id_counter = itertools.count(await self.count())
         hashids = Hashids(salt=author_name)
-        offset = 0
         while True:
-            _id = hashids.encode(len(self.bookmarks) + offset).lower()
-            if _id not in self.bookmarks:
+            _id = hashids.encode(next(self.id_counter)).lower()
+            if await self.get(_id) is None:
                 return _id
-            offset += 1
@@ -1,7 +1,14 @@
+import asyncio
+import itertools
+import logging
 import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from configurations import CONFIG
 
+log = logging.getLogger(__name__)
+
 
 class DB:
     def __init__(self):
@@ -20,3 +27,229 @@ class DB:
 
     def close(self):
         self.conn.close()
+
+
+class AsyncDB:
+    """
+    Постоянное соединение с базой, все запросы выполняются по очереди в отдельном потоке,
+    чтобы задержки диска не блокировали цикл событий.
+    Одинаковые запросы берутся из кэша подготовленных выражений sqlite3.
+    """
+    _instance = None
+
+    def __init__(self, filename=None):
+        self.filename = filename or CONFIG.get('database')
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite')
+        self.conn = None
+
+    @classmethod
+    def get(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def connect(self):
+        self.conn = sqlite3.connect(self.filename, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+                                    cached_statements=CONFIG.get('database_cached_statements', 256))
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL;')
+        self.conn.execute('PRAGMA synchronous=NORMAL;')
+
+    def run_sync(self, statements, fetch=None):
+        if self.conn is None:
+            self.connect()
+        result = None
+        with self.conn:
+            for query, params in statements:
+                cursor = self.conn.execute(query, params)
+                if fetch == 'all':
+                    result = cursor.fetchall()
+                elif fetch == 'one':
+                    result = cursor.fetchone()
+        return result
+
+    async def run(self, statements, fetch=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.run_sync, statements, fetch)
+
+    async def execute(self, query, params=()):
+        await self.run([(query, params)])
+
+    async def transaction(self, statements):
+        """
+        :param statements: список пар (запрос, параметры), выполняются одной транзакцией
+        """
+        await self.run(statements)
+
+    async def fetchall(self, query, params=()):
+        return await self.run([(query, params)], fetch='all')
+
+    async def fetchone(self, query, params=()):
+        return await self.run([(query, params)], fetch='one')
+
+    def close_sync(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.close_sync)
+
+
+class WriteBehindQueue:
+    """
+    Отложенная запись: изменения сразу применяются в памяти, а в базу уходят пачкой одной транзакцией
+    раз в flush_interval секунд, при накоплении max_pending изменений или при остановке бота.
+    Если пачка не записалась, запросы выполняются по одному, а запрос, упавший max_attempts раз, выбрасывается.
+    """
+    _instance = None
+
+    def __init__(self, db, flush_interval=None, max_pending=None, max_attempts=None):
+        self.db = db
+        self.flush_interval = flush_interval or CONFIG.get('write_behind_interval_seconds', 5)
+        self.max_pending = max_pending or CONFIG.get('write_behind_max_pending', 200)
+        self.max_attempts = max_attempts or CONFIG.get('write_behind_max_attempts', 3)
+        self.pending = OrderedDict()
+        self.saves = OrderedDict()
+        self.attempts = {}
+        self.sequence = itertools.count()
+        self.flush_lock = asyncio.Lock()
+        self.task = None
+        self.flush_task = None
+
+    @classmethod
+    def get(cls):
+        if cls._instance is None:
+            cls._instance = cls(AsyncDB.get())
+        return cls._instance
+
+    def put(self, query, params=(), key=None):
+        """
+        :param key: ещё не записанное изменение с тем же ключом заменяется новым
+        """
+        if key is None:
+            key = next(self.sequence)
+        self.pending.pop(key, None)
+        self.pending[key] = (query, params)
+        self.schedule()
+
+    def increment(self, query, key, amount=1):
+        """
+        Счётчики суммируются до записи, запрос получает параметры (*key, amount).
+        """
+        pending_key = ('increment', query, key)
+        if pending_key in self.pending:
+            amount += self.pending[pending_key][1][-1]
+        self.pending[pending_key] = (query, (*key, amount))
+        self.schedule()
+
+    def save_later(self, key, save):
+        """
+        :param save: функция без аргументов, выполняется в потоке базы при следующей записи
+        """
+        self.saves[key] = save
+        self.schedule()
+
+    def __len__(self):
+        return len(self.pending) + len(self.saves)
+
+    def schedule(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if len(self) >= self.max_pending:
+            if self.flush_task is None or self.flush_task.done():
+                self.flush_task = loop.create_task(self.flush())
+        elif self.task is None or self.task.done():
+            self.task = loop.create_task(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        async with self.flush_lock:
+            statements = list(self.pending.items())
+            saves = list(self.saves.items())
+            self.pending.clear()
+            self.saves.clear()
+            if statements:
+                try:
+                    await self.db.transaction([statement for _, statement in statements])
+                    self.attempts.clear()
+                except sqlite3.Error:
+                    log.exception(f'Could not write {len(statements)} pending statements, writing them one by one.')
+                    await self.flush_one_by_one(statements)
+            loop = asyncio.get_running_loop()
+            for key, save in saves:
+                try:
+                    await loop.run_in_executor(self.db.executor, save)
+                    self.attempts.pop(('save', key), None)
+                except Exception:
+                    log.exception(f'Could not save {key}.')
+                    if self.should_retry(('save', key)):
+                        self.saves.setdefault(key, save)
+        if len(self) and (self.task is None or self.task.done() or self.task is asyncio.current_task()):
+            self.task = asyncio.get_running_loop().create_task(self.flush_later())
+
+    async def flush_one_by_one(self, statements):
+        failed = []
+        for key, (query, params) in statements:
+            try:
+                await self.db.execute(query, params)
+                self.attempts.pop(key, None)
+            except sqlite3.Error:
+                log.exception(f'Could not write pending statement {query} {params}.')
+                if self.should_retry(key):
+                    failed.append((key, (query, params)))
+        self.requeue(failed)
+
+    def should_retry(self, key):
+        self.attempts[key] = self.attempts.get(key, 0) + 1
+        if self.attempts[key] < self.max_attempts:
+            return True
+        log.error(f'Dropping pending write {key} after {self.max_attempts} failed attempts.')
+        del self.attempts[key]
+        return False
+
+    def requeue(self, failed):
+        """Неудавшиеся запросы встают в начало очереди, если их не заменили более новые"""
+        retry = OrderedDict()
+        for key, (query, params) in failed:
+            if key not in self.pending:
+                retry[key] = (query, params)
+            elif isinstance(key, tuple) and key[0] == 'increment':
+                newer_query, newer_params = self.pending.pop(key)
+                retry[key] = (newer_query, (*newer_params[:-1], params[-1] + newer_params[-1]))
+            else:
+                self.attempts.pop(key, None)
+        retry.update(self.pending)
+        self.pending = retry
+
+
+class RecordCache:
+    """Ограниченный LRU-кэш записей, прочитанных из базы"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def get(self, key, default=None):
+        if key not in self.items:
+            return default
+        self.items.move_to_end(key)
+        return self.items[key]
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        if len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        return self.items.pop(key, default)
@@ -1,4 +1,3 @@
-import asyncio
 import contextlib
 import datetime
 import math
@@ -7,7 +6,7 @@ import discord
 
 from base_bot import log
 from discord_fake_classes import FakeMessage
-from models import DB
+from models import AsyncDB, WriteBehindQueue
 
 
 class PetRescue:
@@ -49,10 +48,10 @@ class PetRescue:
         return f'{self.message.author.display_name}: {self.mention} {self.pet.name}'
 
     @staticmethod
-    def get_amount():
+    async def get_amount():
         query = "SELECT seq FROM SQLITE_SEQUENCE WHERE name='PetRescue';"
-        db = DB()
-        db_result = db.cursor.execute(query).fetchone()
+        await WriteBehindQueue.get().flush()
+        db_result = await AsyncDB.get().fetchone(query)
         return db_result[0] if db_result else 0
 
     @property
@@ -115,8 +114,7 @@ class PetRescue:
 
     @classmethod
     async def load_rescues(cls, client):
-        db = DB()
-        db_result = db.cursor.execute('SELECT * FROM PetRescue;').fetchall()
+        db_result = await AsyncDB.get().fetchall('SELECT * FROM PetRescue;')
         rescues = []
         broken_rescues = []
         for i, entry in enumerate(db_result, start=1):
@@ -156,7 +154,6 @@ class PetRescue:
                 continue
             rescue.start_time = entry['start_time']
             rescues.append(rescue)
-        db.close()
 
         if broken_rescues:
             log.debug(f'Pruning {len(broken_rescues)} broken pet rescues from the database: {broken_rescues}.')
@@ -166,7 +163,6 @@ class PetRescue:
         return rescues
 
     async def add(self, pet_rescues):
-        db = DB()
         query = 'INSERT INTO PetRescue (guild_name, guild_id, channel_name, channel_id, message_id, pet_id, ' \
                 'alert_message_id, pet_message_id, start_time, lang, mention) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
         channel_type = self.message.channel.type
@@ -189,23 +185,18 @@ class PetRescue:
             str(self.mention),
         ]
         stats_query = 'INSERT INTO PetRescueStats (pet_id, rescues) VALUES (?, ?) ' \
-                      'ON CONFLICT(pet_id) DO UPDATE SET rescues = rescues + 1 WHERE pet_id = ?'
-        stats_params = [self.pet.id, 1, self.pet.id]
+                      'ON CONFLICT(pet_id) DO UPDATE SET rescues = rescues + excluded.rescues'
 
-        lock = asyncio.Lock()
-        async with lock:
-            db.cursor.execute(query, params)
-            db.cursor.execute(stats_query, stats_params)
-            db.commit()
-            db.close()
-            pet_rescues.append(self)
+        pet_rescues.append(self)
+        queue = WriteBehindQueue.get()
+        queue.put(query, params)
+        queue.increment(stats_query, (self.pet.id,))
 
     @staticmethod
-    def get_stats():
-        db = DB()
+    async def get_stats():
         query = 'SELECT * FROM PetRescueStats'
-        db.cursor.execute(query)
-        return db.cursor.fetchall()
+        await WriteBehindQueue.get().flush()
+        return await AsyncDB.get().fetchall(query)
 
     async def remove_from_db(self):
         deletion_id = self.pet_message.id if self.pet_message else 0
@@ -213,13 +204,8 @@ class PetRescue:
 
     @staticmethod
     async def delete_by_id(rescue_id=0, pet_message_id=0):
-        lock = asyncio.Lock()
-        async with lock:
-            db = DB()
-            query = 'DELETE FROM PetRescue WHERE id = ? OR pet_message_id = ?'
-            db.cursor.execute(query, [rescue_id, pet_message_id])
-            db.commit()
-            db.close()
+        query = 'DELETE FROM PetRescue WHERE id = ? OR pet_message_id = ?'
+        WriteBehindQueue.get().put(query, (rescue_id, pet_message_id))
 
     def __str__(self):
         return f"<PetRescue {self.pet.name}" \
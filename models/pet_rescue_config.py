@@ -1,8 +1,6 @@
-import asyncio
-
 import discord
 
-from models import DB
+from models import AsyncDB
 
 
 class PetRescueConfig:
@@ -17,20 +15,16 @@ class PetRescueConfig:
         self.__data = {}
 
     async def load(self):
-        lock = asyncio.Lock()
-        async with lock:
-            db = DB()
-            query = 'SELECT * FROM PetRescueConfig;'
-            db.cursor.execute(query)
-            self.__data = {
-                entry['channel_id']: {
-                    'mention': entry['mention'],
-                    'delete_mention': bool(entry['delete_mention']),
-                    'delete_message': bool(entry['delete_message']),
-                    'delete_pet': bool(entry['delete_pet']),
-                }
-                for entry in db.cursor.fetchall()
+        query = 'SELECT * FROM PetRescueConfig;'
+        self.__data = {
+            entry['channel_id']: {
+                'mention': entry['mention'],
+                'delete_mention': bool(entry['delete_mention']),
+                'delete_message': bool(entry['delete_message']),
+                'delete_pet': bool(entry['delete_pet']),
             }
+            for entry in await AsyncDB.get().fetchall(query)
+        }
 
     def get(self, channel):
         return self.__data.get(channel.id, self.DEFAULT_CONFIG.copy())
@@ -57,36 +51,31 @@ class PetRescueConfig:
         return config
 
     async def set(self, guild, channel, config):
-        lock = asyncio.Lock()
-        async with lock:
-            self.__data[channel.id] = config
-            db = DB()
-            query = """
-            INSERT INTO PetRescueConfig (guild_name, guild_id, channel_name, channel_id, mention, delete_mention,
-             delete_message, delete_pet)
-              VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-              ON CONFLICT (guild_id, channel_id)
-              DO UPDATE SET guild_name=?, guild_id=?, channel_name=?, channel_id=?, mention=?, delete_mention=?,
-               delete_message=?, delete_pet=?;"""
-            channel_type = channel.type
-            if channel_type == discord.ChannelType.private:
-                guild_name = 'Private Message'
-                guild_id = 0
-                channel_name = channel.recipient.name
-            else:
-                guild_id = guild.id
-                guild_name = guild.name
-                channel_name = channel.name
-            params = [
-                guild_name,
-                guild_id,
-                channel_name,
-                channel.id,
-                config['mention'],
-                config['delete_mention'],
-                config['delete_message'],
-                config['delete_pet'],
-            ]
-            db.cursor.execute(query, (*params, *params))
-            db.commit()
-            db.close()
+        self.__data[channel.id] = config
+        query = """
+        INSERT INTO PetRescueConfig (guild_name, guild_id, channel_name, channel_id, mention, delete_mention,
+         delete_message, delete_pet)
+          VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+          ON CONFLICT (guild_id, channel_id)
+          DO UPDATE SET guild_name=?, guild_id=?, channel_name=?, channel_id=?, mention=?, delete_mention=?,
+           delete_message=?, delete_pet=?;"""
+        channel_type = channel.type
+        if channel_type == discord.ChannelType.private:
+            guild_name = 'Private Message'
+            guild_id = 0
+            channel_name = channel.recipient.name
+        else:
+            guild_id = guild.id
+            guild_name = guild.name
+            channel_name = channel.name
+        params = [
+            guild_name,
+            guild_id,
+            channel_name,
+            channel.id,
+            config['mention'],
+            config['delete_mention'],
+            config['delete_message'],
+            config['delete_pet'],
+        ]
+        await AsyncDB.get().execute(query, (*params, *params))
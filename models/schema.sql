@@ -32,6 +32,8 @@ CREATE TABLE IF NOT EXISTS Toplist
     modified    TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+CREATE INDEX IF NOT EXISTS Toplist_author_id ON Toplist (author_id);
+
 CREATE TABLE IF NOT EXISTS PetRescue
 (
     id               INTEGER
@@ -82,6 +84,8 @@ CREATE TABLE IF NOT EXISTS Bookmark
     created     TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL
 );
 
+CREATE INDEX IF NOT EXISTS Bookmark_author_id ON Bookmark (author_id);
+
 CREATE TABLE IF NOT EXISTS Ban
 (
     guild_id    INTEGER NOT NULL
@@ -1,6 +1,4 @@
-import asyncio
-
-from models import DB
+from models import AsyncDB, DB
 
 
 class Subscriptions:
@@ -48,31 +46,21 @@ class Subscriptions:
         else:
             self._subscriptions[s_id] = subscription
         s = self._subscriptions[s_id]
-        lock = asyncio.Lock()
-        async with lock:
-            db = DB()
-            db.cursor.execute('REPLACE INTO Subscription (channel_id, guild_id, guild, channel, pc, switch) '
-                              'VALUES (?, ?, ?, ?, ?, ?)',
-                              (s['channel_id'],
-                               s['guild_id'],
-                               s['guild_name'],
-                               s['channel_name'],
-                               s.get('pc', False),
-                               s.get('switch', False),
-                               ))
-            db.commit()
-            db.close()
+        await AsyncDB.get().execute('REPLACE INTO Subscription (channel_id, guild_id, guild, channel, pc, switch) '
+                                    'VALUES (?, ?, ?, ?, ?, ?)',
+                                    (s['channel_id'],
+                                     s['guild_id'],
+                                     s['guild_name'],
+                                     s['channel_name'],
+                                     s.get('pc', False),
+                                     s.get('switch', False),
+                                     ))
 
     async def remove(self, guild, channel):
         s_id, subscription = self.get_subscription(guild, channel)
         if self.is_subscribed(guild, channel):
             del self._subscriptions[s_id]
-        lock = asyncio.Lock()
-        async with lock:
-            db = DB()
-            db.cursor.execute('DELETE FROM Subscription WHERE channel_id = ?', (subscription['channel_id'],))
-            db.commit()
-            db.close()
+        await AsyncDB.get().execute('DELETE FROM Subscription WHERE channel_id = ?', (subscription['channel_id'],))
 
     def is_subscribed(self, guild, channel):
         subscription_id = self.get_subscription_id(guild, channel)
@@ -1,9 +1,10 @@
-import asyncio
 import datetime
+import itertools
 
 from hashids import Hashids
 
-from models import DB
+from configurations import CONFIG
+from models import AsyncDB, RecordCache
 
 MAX_TOPLIST_LENGTH = 30
 MAX_TOPLISTS = 50
@@ -14,42 +15,50 @@ class ToplistError(Exception):
 
 
 class Toplist:
+    """
+    Топ-листы не загружаются целиком: записи читаются из базы по id или по автору
+    и держатся в ограниченном LRU-кэше.
+    """
+
     def __init__(self):
-        self.toplists = {}
-        self.load()
-
-    def load(self):
-        database = DB()
-        result = database.cursor.execute('SELECT * FROM Toplist;')
-        toplists = result.fetchall()
-        self.toplists = {
-            t['id']: {
-                'id': t['id'],
-                'author_id': t['author_id'],
-                'author_name': t['author_name'],
-                'description': t['description'],
-                'items': t['items'].split(','),
-                'created': t['created'].replace(tzinfo=datetime.timezone.utc),
-                'modified': t['modified'].replace(tzinfo=datetime.timezone.utc),
-            }
-            for t in toplists
+        cache_size = CONFIG.get('user_data_cache_size', 1000)
+        self.toplists = RecordCache(cache_size)
+        self.by_author = RecordCache(cache_size)
+        self.id_counter = None
+
+    @staticmethod
+    def from_row(t):
+        return {
+            'id': t['id'],
+            'author_id': t['author_id'],
+            'author_name': t['author_name'],
+            'description': t['description'],
+            'items': t['items'].split(','),
+            'created': t['created'].replace(tzinfo=datetime.timezone.utc),
+            'modified': t['modified'].replace(tzinfo=datetime.timezone.utc),
         }
-        database.close()
 
-    def get(self, toplist_id):
-        return self.toplists.get(toplist_id)
+    async def get(self, toplist_id):
+        if toplist_id in self.toplists:
+            return self.toplists.get(toplist_id)
+        row = await AsyncDB.get().fetchone('SELECT * FROM Toplist WHERE id = ?;', (toplist_id,))
+        if row is None:
+            return None
+        toplist = self.from_row(row)
+        self.toplists.put(toplist_id, toplist)
+        return toplist
 
     async def add(self, author_id, author_name, description, items, update_id):
         if not update_id:
-            if len(self.get_my_toplists(author_id)) >= MAX_TOPLISTS:
+            if len(await self.get_my_toplists(author_id)) >= MAX_TOPLISTS:
                 raise ToplistError(f'You have reached the maximum amount of '
                                    f'{MAX_TOPLISTS} toplists.'
                                    f' Please consider deleting some using '
                                    f'`!toplist delete <id>`.')
-            update_id = self.generate_new_id(author_name)
-        elif update_id not in self.toplists:
+            update_id = await self.generate_new_id(author_name)
+        elif not (existing := await self.get(update_id)):
             raise ToplistError('The toplist you are trying to update does not exist.')
-        elif str(author_id) != self.toplists[update_id]['author_id']:
+        elif str(author_id) != existing['author_id']:
             raise ToplistError('The toplist you are trying to update belongs to someone else.')
 
         chopped_items = [i.strip() for i in items.split(',')][:MAX_TOPLIST_LENGTH]
@@ -62,61 +71,59 @@ class Toplist:
             'created': datetime.datetime.now(datetime.timezone.utc),
             'modified': datetime.datetime.now(datetime.timezone.utc),
         }
-        lock = asyncio.Lock()
-        async with lock:
-            self.toplists[update_id] = toplist
-            database = DB()
-            database.cursor.execute(
-                'REPLACE INTO Toplist (id, author_id, author_name, description, items, modified) '
-                'VALUES (?, ?, ?, ?, ?, ?)',
-                (update_id,
-                 author_id,
-                 author_name,
-                 description,
-                 ','.join(chopped_items),
-                 toplist['modified'],
-                 ))
-            database.commit()
-            database.close()
+        self.toplists.put(update_id, toplist)
+        if (my_toplists := self.by_author.get(toplist['author_id'])) is not None:
+            my_toplists[update_id] = toplist
+        await AsyncDB.get().execute(
+            'REPLACE INTO Toplist (id, author_id, author_name, description, items, modified) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (update_id,
+             author_id,
+             author_name,
+             description,
+             ','.join(chopped_items),
+             toplist['modified'],
+             ))
         return update_id
 
     async def remove(self, author_id, _id):
-        if _id not in self.toplists:
+        toplist = await self.get(_id)
+        if not toplist:
             raise ToplistError('The toplist you are trying to delete does not exist.')
-        if str(author_id) != self.toplists[_id]['author_id']:
+        if str(author_id) != toplist['author_id']:
             raise ToplistError('The toplist you are trying to delete belongs to someone else.')
-        lock = asyncio.Lock()
-        async with lock:
-            database = DB()
-            database.cursor.execute('DELETE FROM Toplist WHERE id = ?', (_id,))
-            database.commit()
-            database.close()
-            del self.toplists[_id]
+        self.toplists.pop(_id)
+        if (my_toplists := self.by_author.get(toplist['author_id'])) is not None:
+            my_toplists.pop(_id, None)
+        await AsyncDB.get().execute('DELETE FROM Toplist WHERE id = ?', (_id,))
 
     async def append(self, _id, author_id, author_name, new_items):
-        if _id not in self.toplists:
+        toplist = await self.get(_id)
+        if not toplist:
             raise ToplistError('The toplist you are trying to modify does not exist.')
 
-        toplist = self.toplists[_id]
         old_items = ','.join(toplist['items'])
         items = ','.join([old_items, new_items])
         await self.add(author_id, author_name, toplist['description'], items, _id)
         return _id
 
-    def get_my_toplists(self, author_id):
-        return [t for t in self.toplists.values() if str(author_id) == t['author_id']]
-
-    def __len__(self):
-        return len(self.toplists)
-
-    def __iter__(self):
-        yield from self.toplists.values()
-
-    def generate_new_id(self, author_name):
+    async def get_my_toplists(self, author_id):
+        author_id = str(author_id)
+        if author_id not in self.by_author:
+            rows = await AsyncDB.get().fetchall('SELECT * FROM Toplist WHERE author_id = ? ORDER BY rowid;',
+                                                (author_id,))
+            self.by_author.put(author_id, {row['id']: self.from_row(row) for row in rows})
+        return list(self.by_author.get(author_id).values())
+
+    async def count(self):
+        row = await AsyncDB.get().fetchone('SELECT COUNT(*) FROM Toplist;')
+        return row[0]
+
+    async def generate_new_id(self, author_name):
+        if self.id_counter is None:
+            self.id_counter = itertools.count(await self.count())
         hashids = Hashids(salt=author_name)
-        offset = 0
         while True:
-            _id = hashids.encode(len(self.toplists) + offset).lower()
-            if _id not in self.toplists:
+            _id = hashids.encode(next(self.id_counter)).lower()
+            if await self.get(_id) is None:
                 return _id
-            offset += 1
@@ -1,12 +1,11 @@
 import calendar
 import copy
 import datetime
-import importlib
-import json
 import logging
 import operator
 import re
 from collections import defaultdict
+from functools import partial
 
 import translations
 from configurations import CONFIG
@@ -16,7 +15,9 @@ from game_constants import COLORS, EVENT_TYPES, GEM_TUTORIAL_IDS, RARITY_COLORS,
     UNDERWORLD_SOULFORGE_REQUIREMENTS, WEAPON_RARITIES
 from models.bookmark import Bookmark
 from models.toplist import Toplist
-from util import batched, dig, extract_search_tag, get_next_monday_in_locale, greatest_common_divisor, translate_day
+from search_index import SearchIndex
+from translation_cache import TranslationCache
+from util import batched, extract_search_tag, get_next_monday_in_locale, greatest_common_divisor, translate_day
 
 WEEK_DAY_FORMAT = '%b %d'
 
@@ -31,25 +32,32 @@ log = logging.getLogger(__name__)
 log.setLevel(LOGLEVEL)
 log.addHandler(handler)
 
-t = translations.Translations()
+t = translations._instance
 _ = t.get
 
 
-def update_translations():
-    global _
+def load_translations():
+    """
+    :return: новые таблицы переводов, ещё не установленные, или None, если загрузить не удалось
+    """
     try:
-        importlib.reload(translations)
-        _ = translations.Translations().get
-    except (NameError, json.decoder.JSONDecodeError):
+        return t.load()
+    except (NameError, ValueError):
         log.exception('Could not update translations, stacktrace follows.')
 
 
 class TeamExpander:
-    my_emojis = {}
-
-    def __init__(self):
-        world = GameData()
-        world.populate_world_data()
+    _my_emojis = {}
+    emojis_version = 0
+    TROOP_LOOKUP_KEYS = ['name', 'kingdom', 'type', 'roles', 'spell.description', 'shiny']
+    WEAPON_LOOKUP_KEYS = ['name', 'type', 'roles', 'spell.description']
+    FACTION_LOOKUP_KEYS = ['name', 'translated_colors']
+
+    def __init__(self, world=None, bookmarks=None, toplists=None):
+        if world is None:
+            world = GameData()
+            world.populate_world_data()
+        self.world = world
         self.troops = world.troops
         self.troop_types = world.troop_types
         self.spells = world.spells
@@ -71,12 +79,14 @@ class TeamExpander:
         self.task_skip_costs = world.campaign_skip_costs
         self.reroll_tasks = world.campaign_rerolls
         self.soulforge = world.soulforge
+        self.soulforge_weapons = world.soulforge_weapons
         self.summons = world.summons
         self.traitstones = world.traitstones
         self.levels = world.levels
         self.rooms = {}
-        self.toplists = Toplist()
-        self.bookmarks = Bookmark()
+        # Пользовательские данные не зависят от игровых и переживают перезагрузку мира
+        self.toplists = toplists or Toplist()
+        self.bookmarks = bookmarks or Bookmark()
         self.adventure_board = world.adventure_board
         self.drop_chances = world.drop_chances
         self.event_key_drops = world.event_chest_drops
@@ -87,12 +97,26 @@ class TeamExpander:
         self.user_data = world.user_data
         self.hoard_potions = world.hoard_potions
         self.orbs = world.orbs
+        # Индексы строятся для переводов на момент сборки, при их перезагрузке собирается новый TeamExpander
+        self.search_data = {}
+        self.translation_cache = TranslationCache(CONFIG.get('translation_cache_size', 5000))
+        # Коды команд присылают пользователи, отдельный кэш не даёт им вытеснить переводы
+        self.team_cache = TranslationCache(CONFIG.get('team_cache_size', 500))
 
     @classmethod
     def extract_code_from_message(cls, raw_code):
         return [int(n.strip()) for n in raw_code.split(',') if n and n.isdigit()]
 
     def get_team_from_code(self, code, lang):
+        """
+        Раскрытая команда запоминается целиком по (код, язык) в отдельном небольшом кэше,
+        войска и оружие из пересекающихся команд берутся из общего кэша переводов.
+        """
+        key = ('team', tuple(code), lang)
+        team = self.team_cache.get(key, lambda: self.expand_team_code(code, lang), self.translation_version())
+        return {**team, 'troops': [troop.copy() for troop in team['troops']]}
+
+    def expand_team_code(self, code, lang):
         result = {
             'troops': [],
             'banner': {},
@@ -106,15 +130,11 @@ class TeamExpander:
 
         for i, element in enumerate(code):
             if troop := self.troops.get(element):
-                troop = troop.copy()
-                self.translate_troop(troop, lang)
-                result['troops'].append(troop)
+                result['troops'].append(self.translated(troop, lang, self.translate_troop))
                 continue
 
             if weapon := self.weapons.get(element):
-                weapon = weapon.copy()
-                self.translate_weapon(weapon, lang)
-                result['troops'].append(weapon)
+                result['troops'].append(self.translated(weapon, lang, self.translate_weapon))
                 has_weapon = True
                 continue
 
@@ -184,50 +204,89 @@ class TeamExpander:
         else:
             return
 
-    @staticmethod
-    def search_item(search_term, lang, items, lookup_keys, translator, sort_by='name'):
+    @property
+    def my_emojis(self):
+        return self._my_emojis
+
+    @my_emojis.setter
+    def my_emojis(self, emojis):
+        """Эмодзи входят в переведённые объекты, поэтому их замена сбрасывает кэш переводов"""
+        self._my_emojis = emojis
+        self.emojis_version += 1
+
+    def translation_version(self):
+        return t.version, self.emojis_version
+
+    def translated(self, item, lang, translator):
+        """Переведённая копия объекта, каждая пара (объект, язык) переводится только один раз"""
+        def build():
+            result = item.copy()
+            translator(result, lang)
+            return result
+
+        key = (translator.__name__, item['id'], lang)
+        return self.translation_cache.get(key, build, self.translation_version()).copy()
+
+    def get_search_data(self, key, build):
+        """Поисковые теги и индексы считаются один раз на язык, обычно заранее в build_search_indexes"""
+        if key not in self.search_data:
+            self.search_data[key] = build()
+        return self.search_data[key]
+
+    def get_search_index(self, lang, items, lookup_keys, translator):
+        key = (translator.__name__, tuple(lookup_keys), lang)
+        return self.get_search_data(key, lambda: SearchIndex(items, lookup_keys, translator, lang))
+
+    def get_factions(self):
+        return {k: v for k, v in self.kingdoms.items() if v['underworld']}
+
+    def build_search_indexes(self, languages=None):
+        """
+        Строит поисковые индексы и теги для всех языков заранее, в рабочем потоке при загрузке мира,
+        чтобы первый поиск на каждом языке не переводил все объекты в цикле событий.
+        """
+        languages = languages or [lang for lang in translations.LANGUAGES
+                                  if lang not in translations.LANGUAGE_CODE_MAPPING]
+        indexes = [
+            (self.troops, self.TROOP_LOOKUP_KEYS, self.translate_troop),
+            (self.kingdoms, ['name'], self.translate_kingdom),
+            (self.get_factions(), self.FACTION_LOOKUP_KEYS, self.translate_kingdom),
+            (self.classes, ['name'], self.translate_class),
+            (self.weapons, self.WEAPON_LOOKUP_KEYS, self.translate_weapon),
+            (self.traitstones, ['name'], self.translate_traitstone),
+        ]
+        for lang in languages:
+            builds = [partial(self.get_search_index, lang, *index) for index in indexes] + [
+                partial(self.get_search_data, ('talents', lang), partial(self.get_talent_search_tags, lang)),
+                partial(self.get_search_data, ('traits', lang), partial(self.get_trait_search_tags, lang)),
+            ]
+            for build in builds:
+                try:
+                    build()
+                except Exception:
+                    log.exception(f'Could not build a search index for {lang}, it will be built on first search.')
+
+    def search_item(self, search_term, lang, items, lookup_keys, translator, sort_by='name'):
         if search_term.startswith('#'):
             search_term = search_term[1:]
         if search_term.isdigit():
             if item := items.get(int(search_term)):
-                result = item.copy()
-                translator(result, lang)
-                return [result]
+                return [self.translated(item, lang, translator)]
             return []
         possible_matches = []
         real_search = extract_search_tag(search_term)
         if not real_search:
             return []
-        for base_item in items.values():
-            if base_item['name'] == '`?`' or base_item['id'] == '`?`':
-                continue
-            item = base_item.copy()
-            translator(item, lang)
-            lookups = {
-                k: extract_search_tag(dig(item, k)) for k in lookup_keys
-            }
-
-            if real_search == extract_search_tag(item['name']):
-                return [item]
-            for key, lookup in lookups.items():
-                if real_search in lookup:
-                    possible_matches.append(item)
-                    break
+        index = self.get_search_index(lang, items, lookup_keys, translator)
+        for key in index.search(real_search):
+            possible_matches.append(self.translated(items[key], lang, translator))
 
         return sorted(possible_matches, key=operator.itemgetter(sort_by))
 
     def search_troop(self, search_term, lang):
-        lookup_keys = [
-            'name',
-            'kingdom',
-            'type',
-            'roles',
-            'spell.description',
-            'shiny',
-        ]
         return self.search_item(search_term, lang,
                                 items=self.troops,
-                                lookup_keys=lookup_keys,
+                                lookup_keys=self.TROOP_LOOKUP_KEYS,
                                 translator=self.translate_troop)
 
     def translate_troop(self, troop, lang):
@@ -295,15 +354,12 @@ class TeamExpander:
                                 translator=self.translate_kingdom)
 
     def search_faction(self, search_term, lang):
-        lookup_keys = ['name', 'translated_colors']
-        items = {k: v for k, v in self.kingdoms.items() if v['underworld']}
-        return self.search_item(search_term, lang, items=items, lookup_keys=lookup_keys,
+        return self.search_item(search_term, lang, items=self.get_factions(), lookup_keys=self.FACTION_LOOKUP_KEYS,
                                 translator=self.translate_kingdom)
 
     def kingdom_summary(self, lang):
-        kingdoms = [k.copy() for k in self.kingdoms.values() if k['location'] == 'krystara' and len(k['colors']) > 0]
-        for kingdom in kingdoms:
-            self.translate_kingdom(kingdom, lang)
+        kingdoms = [self.translated(k, lang, self.translate_kingdom) for k in self.kingdoms.values()
+                    if k['location'] == 'krystara' and len(k['colors']) > 0]
         return sorted(kingdoms, key=operator.itemgetter('name'))
 
     def translate_kingdom(self, kingdom, lang):
@@ -318,9 +374,7 @@ class TeamExpander:
         for troop_id in kingdom['troop_ids']:
             if troop_id not in self.troops:
                 continue
-            troop = self.troops[troop_id].copy()
-            self.translate_troop(troop, lang)
-            kingdom['troops'].append(troop)
+            kingdom['troops'].append(self.translated(self.troops[troop_id], lang, self.translate_troop))
 
         kingdom['troops'] = sorted(kingdom['troops'], key=operator.itemgetter('name'))
         kingdom['weapons_title'] = _('[WEAPONS:]', lang)
@@ -345,7 +399,7 @@ class TeamExpander:
         if 'primary_color' in kingdom:
             deed_num = COLORS.index(kingdom['primary_color'])
             kingdom['deed'] = _(f'[DEED{deed_num:02d}]', lang)
-        color_emojis = [self.my_emojis.get(c) for c in kingdom['colors']]
+        color_emojis = [self.my_emojis.get(c, '') for c in kingdom['colors']]
         kingdom['color_emojis'] = "".join(color_emojis)
         kingdom['translated_colors'] = [_(f'[GEM_{c.upper()}]', lang) for c in kingdom['colors']]
         kingdom['color_title'] = _('[GEM_MASTERY]', lang)
@@ -361,9 +415,7 @@ class TeamExpander:
         if 'event_weapon' in kingdom:
             kingdom['event_weapon_title'] = _('[FACTION_WEAPON]', lang)
             kingdom['event_weapon_id'] = kingdom['event_weapon']['id']
-            event_weapon = kingdom['event_weapon'].copy()
-            self.translate_weapon(event_weapon, lang)
-            kingdom['event_weapon'] = event_weapon
+            kingdom['event_weapon'] = self.translated(kingdom['event_weapon'], lang, self.translate_weapon)
         kingdom['max_power_level_title'] = _('[KINGDOM_POWER_LEVELS]', lang)
 
     def search_class(self, search_term, lang):
@@ -374,9 +426,7 @@ class TeamExpander:
                                 lookup_keys=lookup_keys)
 
     def class_summary(self, lang):
-        classes = [c.copy() for c in self.classes.values()]
-        for c in classes:
-            self.translate_class(c, lang)
+        classes = [self.translated(c, lang, self.translate_class) for c in self.classes.values()]
         return sorted(classes, key=operator.itemgetter('name'))
 
     def translate_class(self, _class, lang):
@@ -416,13 +466,21 @@ class TeamExpander:
             result.append(tree)
         return sorted(result, key=operator.itemgetter('name'))
 
+    def get_talent_search_tags(self, lang):
+        return {
+            code: (
+                extract_search_tag(_(tree['name'], lang)),
+                [extract_search_tag(_(talent['name'], lang)) for talent in tree['talents']],
+            )
+            for code, tree in self.talent_trees.items()
+        }
+
     def search_talent(self, search_term, lang):
         possible_matches = []
-        for tree in self.talent_trees.values():
-            translated_name = extract_search_tag(_(tree['name'], lang))
-            translated_talents = [_(talent['name'], lang) for talent in tree['talents']]
-            talents_search_tags = [extract_search_tag(talent) for talent in translated_talents]
-            real_search = extract_search_tag(search_term)
+        search_tags = self.get_search_data(('talents', lang), lambda: self.get_talent_search_tags(lang))
+        real_search = extract_search_tag(search_term)
+        for code, tree in self.talent_trees.items():
+            translated_name, talents_search_tags = search_tags[code]
             if real_search == translated_name or real_search in talents_search_tags:
                 result = tree.copy()
                 self.translate_talent_tree(result, lang)
@@ -465,23 +523,26 @@ class TeamExpander:
     def get_classes_with_trait(self, trait, lang):
         return self.get_objects_by_trait(trait, self.classes, self.translate_class, lang)
 
-    @staticmethod
-    def get_objects_by_trait(trait, objects, translator, lang):
+    def get_objects_by_trait(self, trait, objects, translator, lang):
         result = []
         for o in objects.values():
             trait_codes = [trait['code'] for trait in o['traits']] if 'traits' in o else []
             if trait['code'] in trait_codes:
-                translated_object = o.copy()
-                translator(translated_object, lang)
-                result.append(translated_object)
+                result.append(self.translated(o, lang, translator))
         return result
 
+    def get_trait_search_tags(self, lang):
+        return {
+            code: (extract_search_tag(_(trait['name'], lang)), extract_search_tag(_(trait['description'], lang)))
+            for code, trait in self.traits.items()
+        }
+
     def search_trait(self, search_term, lang):
         possible_matches = []
+        search_tags = self.get_search_data(('traits', lang), lambda: self.get_trait_search_tags(lang))
+        real_search = extract_search_tag(search_term)
         for code, trait in self.traits.items():
-            translated_name = extract_search_tag(_(trait['name'], lang))
-            translated_description = extract_search_tag(_(trait['description'], lang))
-            real_search = extract_search_tag(search_term)
+            translated_name, translated_description = search_tags[code]
             if real_search == translated_name:
                 result = trait.copy()
                 result['troops'] = self.get_troops_with_trait(trait, lang)
@@ -504,15 +565,9 @@ class TeamExpander:
         return self.pets.search(search_term, lang)
 
     def search_weapon(self, search_term, lang):
-        lookup_keys = [
-            'name',
-            'type',
-            'roles',
-            'spell.description',
-        ]
         return self.search_item(search_term, lang,
                                 items=self.weapons,
-                                lookup_keys=lookup_keys,
+                                lookup_keys=self.WEAPON_LOOKUP_KEYS,
                                 translator=self.translate_weapon)
 
     def translate_weapon(self, weapon, lang):
@@ -576,8 +631,7 @@ class TeamExpander:
         real_search = extract_search_tag(search_term)
         results = {}
         for weapon in self.weapons.values():
-            my_weapon = weapon.copy()
-            self.translate_weapon(my_weapon, lang)
+            my_weapon = self.translated(weapon, lang, self.translate_weapon)
             affixes = [affix for affix in my_weapon['upgrades'] if 'cost' in affix]
             for affix in affixes:
                 search_name = extract_search_tag(affix['name'])
@@ -635,6 +689,11 @@ class TeamExpander:
         traitstone['kingdoms_title'] = _('[KINGDOMS]', lang)
 
     def translate_spell(self, spell_id, lang):
+        key = ('translate_spell', spell_id, lang)
+        return self.translation_cache.get(key, lambda: self.build_spell_translation(spell_id, lang),
+                                          self.translation_version()).copy()
+
+    def build_spell_translation(self, spell_id, lang):
         spell = self.spells[spell_id]
         magic = _('[MAGIC]', lang)
 
@@ -852,6 +911,9 @@ class TeamExpander:
         result['texts'] = {
             'campaign': _('[CAMPAIGN]', lang),
             'team': _('[LITE_CHAT_TEAM_START]', lang),
+            'skip_task': _('[SKIP_TASK]', lang),
+            'gems': _('[GEMS]', lang),
+            **{category: _(category, lang) for category in result['campaigns']},
         }
         return result
 
@@ -1029,8 +1091,8 @@ class TeamExpander:
             for level in self.levels
         ]
 
-    def translate_toplist(self, toplist_id, lang):
-        toplist = self.toplists.get(toplist_id)
+    async def translate_toplist(self, toplist_id, lang):
+        toplist = await self.toplists.get(toplist_id)
         if not toplist:
             return None
         result = toplist.copy()
@@ -1047,7 +1109,7 @@ class TeamExpander:
     async def create_toplist(self, message, description, items, lang, update_id):
         toplist_id = await self.toplists.add(message.author.id, message.author.display_name, description, items,
                                              update_id)
-        return self.translate_toplist(toplist_id, lang)
+        return await self.translate_toplist(toplist_id, lang)
 
     def kingdom_percentage(self, filter_name, filter_values, lang):
         result = {}
@@ -1129,6 +1191,13 @@ class TeamExpander:
                 result.append(str(items[0]['id']))
         return result
 
+    def get_upcoming_soulforge_weapon_ids(self):
+        """Оружие, которое можно будет скрафтить в кузнице душ на неделе со следующего понедельника"""
+        start_date = get_next_monday_in_locale(date=None, lang='en')[1]
+        return [weapon_id
+                for week in self.soulforge_weapons if week['start'] <= start_date < week['end']
+                for weapon_id in week['weapon_ids']]
+
     def get_soulforge_weapon_image_data(self, search_term, date, switch, lang):
         search_result = self.search_weapon(search_term, lang)
         if len(search_result) != 1:
@@ -1330,9 +1399,7 @@ class TeamExpander:
             result['troops'] = []
             del result['names']
             for troop_id in b['ids']:
-                troop = self.troops.get(troop_id).copy()
-                self.translate_troop(troop, lang)
-                result['troops'].append(troop)
+                result['troops'].append(self.translated(self.troops.get(troop_id), lang, self.translate_troop))
             return result
 
         troop_restriction_types = (
@@ -1416,14 +1483,13 @@ class TeamExpander:
         return storms
 
     def get_warbands(self, lang):
-        warbands = [k.copy() for k in self.kingdoms.values()
+        warbands = [self.translated(k, lang, self.translate_kingdom) for k in self.kingdoms.values()
                     if 'WARBAND' in k['reference_name']
                     and k['colors']
                     ]
         warband_teams = self.user_data['pEconomyModel']['WarbandTeams']
         available_warbands = [warband_teams[str(w)][0]['Data'] for w in self.user_data['pShopWarbandsData']]
         for warband in warbands:
-            self.translate_kingdom(warband, lang)
             if ':' in warband['name']:
                 warband['name'] = warband['name'].split(':')[1].strip()
             warband['available'] = ''
@@ -1432,9 +1498,7 @@ class TeamExpander:
         return warbands
 
     def get_banners(self, lang):
-        banners = [k.copy() for k in self.kingdoms.values() if k.get('colors')]
-        for banner in banners:
-            self.translate_kingdom(banner, lang)
+        banners = [self.translated(k, lang, self.translate_kingdom) for k in self.kingdoms.values() if k.get('colors')]
         return sorted(banners, key=lambda x: x['banner']['name'])
 
     def get_map_data(self, lang, location):
@@ -1471,8 +1535,7 @@ class TeamExpander:
                 continue
             if is_pseudo_kingdom(kingdom):
                 continue
-            my_kingdom = kingdom.copy()
-            self.translate_kingdom(my_kingdom, lang)
+            my_kingdom = self.translated(kingdom, lang, self.translate_kingdom)
             if self.is_untranslated(my_kingdom['name']):
                 continue
             result['kingdoms'].append(my_kingdom)
@@ -1557,8 +1620,8 @@ class TeamExpander:
         return result
 
     def faction_summary(self, lang):
-        factions = [k.copy() for k in self.kingdoms.values() if k['underworld'] and k['troop_ids']]
-        [self.translate_kingdom(f, lang) for f in factions]
+        factions = [self.translated(k, lang, self.translate_kingdom) for k in self.kingdoms.values()
+                    if k['underworld'] and k['troop_ids']]
         return sorted(factions, key=operator.itemgetter('name'))
 
     def get_hoard_potions(self, lang):
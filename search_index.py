@@ -0,0 +1,58 @@
+from collections import defaultdict
+
+from util import dig, extract_search_tag
+
+
+class SearchIndex:
+    """
+    Инвертированный индекс по n-граммам поисковых тегов для одного набора объектов на одном языке.
+    Строится один раз после загрузки мира, при поиске переводятся только найденные объекты.
+    """
+    N = 3
+
+    def __init__(self, items, lookup_keys, translator, lang):
+        self.order = {}
+        self.names = {}
+        self.tags = {}
+        self.postings = defaultdict(set)
+        for position, (key, base_item) in enumerate(items.items()):
+            if base_item['name'] == '`?`' or base_item['id'] == '`?`':
+                continue
+            item = base_item.copy()
+            translator(item, lang)
+            tags = [extract_search_tag(dig(item, k)) for k in lookup_keys]
+            self.order[key] = position
+            self.names[key] = extract_search_tag(item['name'])
+            self.tags[key] = tags
+            for gram in set().union(*(self.ngrams(tag) for tag in tags + [self.names[key]])):
+                self.postings[gram].add(key)
+
+    @classmethod
+    def ngrams(cls, text):
+        return {text[i:i + cls.N] for i in range(len(text) - cls.N + 1)}
+
+    def candidates(self, real_search):
+        if len(real_search) < self.N:
+            return self.tags.keys()
+        postings = sorted((self.postings.get(gram, set()) for gram in self.ngrams(real_search)), key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            if not result:
+                break
+            result &= posting
+        return result
+
+    def search(self, real_search):
+        """
+        :param real_search: поисковый тег, см. extract_search_tag
+        :return: ключи подходящих объектов в исходном порядке,
+                 либо только первый объект, имя которого совпало полностью
+        """
+        matches = sorted(
+            (key for key in self.candidates(real_search)
+             if self.names[key] == real_search or any(real_search in tag for tag in self.tags[key])),
+            key=self.order.get)
+        for key in matches:
+            if self.names[key] == real_search:
+                return [key]
+        return matches
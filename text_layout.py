@@ -0,0 +1,76 @@
+import math
+from collections import OrderedDict
+from textwrap import wrap
+
+
+class TextLayout:
+    """
+    Подбор переноса строк и размера шрифта под прямоугольник.
+    Размеры текста кэшируются по (шрифт, размер, обводка, текст), готовые раскладки — вместе с размерами прямоугольника.
+    Ширины переноса перебираются с пропуском тех, что дают тот же перенос, что и предыдущая.
+    """
+    FONT_STEP = 0.75
+    MAX_STEPS = 99
+
+    def __init__(self, maxsize=20000):
+        self.maxsize = maxsize
+        self.metrics = OrderedDict()
+        self.layouts = OrderedDict()
+
+    def remember(self, cache, key, value):
+        cache[key] = value
+        if len(cache) > self.maxsize:
+            cache.popitem(last=False)
+        return value
+
+    def measure(self, image, draw, text):
+        key = draw.font, draw.font_size, draw.stroke_width, text
+        if key in self.metrics:
+            self.metrics.move_to_end(key)
+            return self.metrics[key]
+        metrics = draw.get_font_metrics(image, text, True)
+        return self.remember(self.metrics, key, (metrics.text_width, metrics.text_height))
+
+    def fit_width(self, image, draw, text, roi_width):
+        """
+        :return: текст с самыми длинными строками, которые ещё влезают по ширине, или None
+        """
+        if self.measure(image, draw, text)[0] <= roi_width:
+            return text
+        columns = len(text) - 1
+        while columns > 0:
+            lines = wrap(text, columns)
+            wrapped = '\n'.join(lines)
+            if self.measure(image, draw, wrapped)[0] <= roi_width:
+                return wrapped
+            # все ширины от самой длинной строки до columns дают тот же перенос
+            columns = min(columns, max(len(line) for line in lines)) - 1
+        return None
+
+    def fit(self, image, draw, text, roi_width, roi_height, font_size):
+        draw.font_size = font_size
+        if self.measure(image, draw, text)[1] > roi_height:
+            return None
+        wrapped = self.fit_width(image, draw, text, roi_width)
+        if wrapped is not None and self.measure(image, draw, wrapped)[1] <= roi_height:
+            return wrapped
+        return None
+
+    def word_wrap(self, image, draw, text, roi_width, roi_height):
+        start_size = draw.font_size
+        key = draw.font, start_size, draw.stroke_width, text, roi_width, roi_height
+        if key not in self.layouts:
+            steps = min(self.MAX_STEPS, math.ceil(start_size / self.FONT_STEP) - 1)
+            result = None
+            for step in range(steps + 1):
+                font_size = start_size - step * self.FONT_STEP
+                if (wrapped := self.fit(image, draw, text, roi_width, roi_height, font_size)) is not None:
+                    result = font_size, wrapped
+                    break
+            self.remember(self.layouts, key, result)
+        self.layouts.move_to_end(key)
+        if self.layouts[key] is None:
+            draw.font_size = start_size
+            raise RuntimeError(f"Unable to calculate word_wrap for {text}")
+        draw.font_size, wrapped = self.layouts[key]
+        return wrapped
@@ -0,0 +1,50 @@
+from collections import OrderedDict
+
+
+class TranslationCache:
+    """
+    LRU-кэш переведённых объектов (войска, оружие, королевства, классы, заклинания) по ключу (тип, id, язык).
+    Полностью сбрасывается, когда меняется версия: перезагрузка переводов или эмодзи.
+    """
+
+    def __init__(self, maxsize=5000):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build, version=None):
+        """
+        :param key: хэшируемый ключ, например ('translate_troop', 6000, 'en')
+        :param build: функция без аргументов, строящая значение при промахе
+        :param version: если отличается от прошлой, кэш очищается
+        :return: закэшированное значение, его нельзя изменять
+        """
+        if version != self.version:
+            self.items.clear()
+            self.version = version
+        if key in self.items:
+            self.hits += 1
+            self.items.move_to_end(key)
+            return self.items[key]
+        self.misses += 1
+        value = build()
+        self.items[key] = value
+        if len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+        return value
+
+    def clear(self):
+        self.items.clear()
+        self.version = None
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            'size': len(self.items),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / requests if requests else 0.0,
+        }
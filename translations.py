@@ -1,5 +1,10 @@
+import contextlib
+import contextvars
 import json
 import os
+import sys
+from array import array
+from collections.abc import Mapping
 
 import humanize
 from game_assets import GameAssets
@@ -34,33 +39,121 @@ LOCALE_MAPPING = {
 LANG_FILES = [f'GemsOfWar_{language}.json' for language in LANGUAGES.values()]
 
 
+class LanguageTable(Mapping):
+    """
+    Переводы одного языка в компактном виде: все значения склеены в одну строку,
+    а по номеру ключа из общего для всех языков индекса хранятся границы значения.
+    """
+
+    def __init__(self, key_index, values):
+        self.key_index = key_index
+        self.present = bytearray(len(key_index))
+        self.offsets = array('L', bytes(array('L').itemsize * (len(key_index) + 1)))
+        parts = []
+        position = 0
+        for index in range(len(key_index)):
+            value = values.get(index)
+            if value is not None:
+                self.present[index] = 1
+                parts.append(value)
+                position += len(value)
+            self.offsets[index + 1] = position
+        self.text = ''.join(parts)
+
+    def get(self, key, default=None):
+        index = self.key_index.get(key)
+        if index is None or not self.present[index]:
+            return default
+        return self.text[self.offsets[index]:self.offsets[index + 1]]
+
+    def __getitem__(self, key):
+        index = self.key_index.get(key)
+        if index is None or not self.present[index]:
+            raise KeyError(key)
+        return self.text[self.offsets[index]:self.offsets[index + 1]]
+
+    def __contains__(self, key):
+        index = self.key_index.get(key)
+        return index is not None and bool(self.present[index])
+
+    def __iter__(self):
+        return (key for key, index in self.key_index.items() if self.present[index])
+
+    def __len__(self):
+        return sum(self.present)
+
+
 class Translations:
     BASE_LANG = 'en'
+    # Таблицы, которые видны только в текущем контексте (рабочем потоке перезагрузки) до установки
+    staged = contextvars.ContextVar('staged_translations', default=None)
 
     def __init__(self):
-        self.all_translations = {}
+        self.installed = {}, 0
+        self.reload()
+
+    @property
+    def all_translations(self):
+        return (self.staged.get() or self.installed)[0]
+
+    @property
+    def version(self):
+        return (self.staged.get() or self.installed)[1]
+
+    def reload(self):
+        self.install(self.load())
+
+    def install(self, all_translations):
+        """Подменяет таблицы целиком, не мешая параллельным get()"""
+        self.installed = all_translations, self.installed[1] + 1
+
+    @contextlib.contextmanager
+    def staging(self, all_translations):
+        """Переводит в текущем контексте по ещё не установленным таблицам, с версией, которую они получат при установке"""
+        token = self.staged.set((all_translations, self.installed[1] + 1))
+        try:
+            yield
+        finally:
+            self.staged.reset(token)
+
+    def load(self):
+        """Загружает все языки заново в новые таблицы, текущие не трогает"""
+        key_index = {}
+        all_values = {}
         # Загружаем только базовый язык (английский) и русский, так как он установлен по умолчанию
         languages_to_load = {'en': 'English', 'ru': 'Russian'}
         for lang_code, language in languages_to_load.items():
             try:
-                self.all_translations[lang_code] = GameAssets.load(
-                    f'GemsOfWar_{language}.json')
+                values = {}
+                for key, value in GameAssets.iter_sections(f'GemsOfWar_{language}.json'):
+                    values[self.key_number(key_index, key)] = value
                 addon_filename = f'extra_translations/{language}.json'
                 if os.path.exists(addon_filename):
                     with open(addon_filename, encoding='utf8') as f:
                         addon_translations = json.load(f)
-                    self.all_translations[lang_code].update(addon_translations)
+                    for key, value in addon_translations.items():
+                        values[self.key_number(key_index, key)] = value
+                all_values[lang_code] = values
             except FileNotFoundError:
                 print(f"Warning: Could not load translations for {language}")
                 if lang_code == self.BASE_LANG:
                     raise  # Если не можем загрузить базовый язык, выбрасываем ошибку
+        return {lang: LanguageTable(key_index, values) for lang, values in all_values.items()}
+
+    @staticmethod
+    def key_number(key_index, key):
+        number = key_index.get(key)
+        if number is None:
+            number = key_index[sys.intern(key)] = len(key_index)
+        return number
 
     def get(self, key, lang='', default=None, plural=False):
-        if lang not in self.all_translations:
+        all_translations = self.all_translations
+        if lang not in all_translations:
             lang = self.BASE_LANG
         if not default:
             default = key
-        result = self.all_translations[lang].get(key, default)
+        result = all_translations[lang].get(key, default)
         return self.pluralize(result, plural)
 
     @staticmethod
@@ -84,7 +177,7 @@ class HumanizeTranslator:
         humanize.i18n.deactivate()
 
 
-# Создаем глобальный экземпляр переводчика
+# Единственный экземпляр переводчика на весь процесс, остальные модули используют его
 _instance = Translations()
 
 def _(key: str, lang: str = 'en', default: str = None, plural: bool = False) -> str:
@@ -1,6 +1,17 @@
+import asyncio
+import random
+import re
+import sqlite3
 import unittest
+from textwrap import wrap
 
+from command_registry import COMMAND_ROUTER, CommandRouter
 from data_source import PetContainer, Pets
+from models.db import WriteBehindQueue
+from search_index import SearchIndex
+from text_layout import TextLayout
+from translation_cache import TranslationCache
+from translations import LanguageTable, Translations
 
 
 class PetTests(unittest.TestCase):
@@ -33,5 +44,203 @@ class PetTests(unittest.TestCase):
         self.assertDictEqual(search_result[0].data, self.pets[13000]['en'].data)
 
 
+class TranslationTests(unittest.TestCase):
+    def setUp(self):
+        key_index = {'[TROOPS]': 0, '[EMPTY]': 1, '[MISSING]': 2}
+        self.table = LanguageTable(key_index, {0: 'Troops', 1: ''})
+
+    def test_lookup(self):
+        self.assertEqual(self.table['[TROOPS]'], 'Troops')
+        self.assertEqual(self.table['[EMPTY]'], '')
+        self.assertIsNone(self.table.get('[MISSING]'))
+        self.assertNotIn('[MISSING]', self.table)
+
+    def test_mapping(self):
+        self.assertDictEqual(dict(self.table), {'[TROOPS]': 'Troops', '[EMPTY]': ''})
+
+    def test_pluralize(self):
+        self.assertEqual(Translations.pluralize('Board\x19\x19s\x19', True), 'Boards')
+        self.assertEqual(Translations.pluralize('Board\x19\x19s\x19', False), 'Board')
+
+
+class SearchIndexTests(unittest.TestCase):
+    def setUp(self):
+        items = {
+            1: {'id': 1, 'name': 'Goblin', 'type': 'Goblin'},
+            2: {'id': 2, 'name': 'Goblin King', 'type': 'Goblin'},
+            3: {'id': 3, 'name': 'Dwarf', 'type': 'Dwarf'},
+        }
+        self.index = SearchIndex(items, ['name', 'type'], lambda item, lang: None, 'en')
+
+    def test_substring(self):
+        self.assertEqual(self.index.search('dwar'), [3])
+        self.assertEqual(self.index.search('king'), [2])
+        self.assertEqual(self.index.search('dragon'), [])
+
+    def test_exact_name(self):
+        self.assertEqual(self.index.search('goblin'), [1])
+
+    def test_short_term(self):
+        self.assertEqual(self.index.search('g'), [1, 2])
+
+
+class TranslationCacheTests(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = TranslationCache(maxsize=2)
+        cache.get('a', lambda: 1)
+        cache.get('b', lambda: 2)
+        cache.get('a', lambda: None)
+        cache.get('c', lambda: 3)
+        self.assertEqual(list(cache.items), ['a', 'c'])
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+    def test_version_change(self):
+        cache = TranslationCache()
+        cache.get('a', lambda: 1, version=1)
+        self.assertEqual(cache.get('a', lambda: 2, version=2), 2)
+
+
+class CommandRouterTests(unittest.TestCase):
+    def route(self, user_command, user_prefix='!'):
+        command, groups = COMMAND_ROUTER.route(user_command, user_prefix)
+        return command and command['function'], groups
+
+    def test_keyword(self):
+        function, groups = self.route('de-!tr Goblin')
+        self.assertEqual(function, 'troop')
+        self.assertEqual((groups['lang'], groups['shortened'], groups['search_term']), ('de', '-', 'Goblin'))
+        self.assertEqual(self.route('!ce')[0], 'current_event')
+        self.assertEqual(self.route('!spoilers events')[0], 'events')
+
+    def test_prefix_mismatch(self):
+        self.assertEqual(self.route('?troop Goblin'), (None, None))
+        self.assertEqual(self.route('$troop Goblin', '$')[0], 'troop')
+
+    def test_team_code(self):
+        self.assertEqual(self.route('look at this\n[6000,6001]')[0], 'team_code')
+
+    def test_keyword_first_chars(self):
+        def first_chars(keyword):
+            return CommandRouter.get_keyword_first_chars(re.compile(f'^(?P<prefix>.){keyword}$'))
+
+        self.assertEqual(first_chars('tr(oop)? #?(?P<search_term>.*)'), {'t'})
+        self.assertEqual(first_chars('(pr|rp|pet rescue) config'), {'p', 'r'})
+        self.assertEqual(first_chars('(spoilers? )?events?'), {'s', 'e'})
+        self.assertIsNone(first_chars('(?P<code>.+)'))
+        self.assertIsNone(first_chars('s?tats'))
+
+
+class WriteBehindQueueTests(unittest.TestCase):
+    def test_coalescing(self):
+        queue = WriteBehindQueue(db=None, flush_interval=1, max_pending=10)
+        queue.put('UPDATE Prefix SET value = ?', ('!',), key=('Prefix', 1))
+        queue.put('UPDATE Prefix SET value = ?', ('$',), key=('Prefix', 1))
+        queue.increment('INSERT INTO Stats VALUES (?, ?)', (5,))
+        queue.increment('INSERT INTO Stats VALUES (?, ?)', (5,), amount=2)
+        self.assertEqual(list(queue.pending.values()), [
+            ('UPDATE Prefix SET value = ?', ('$',)),
+            ('INSERT INTO Stats VALUES (?, ?)', (5, 3)),
+        ])
+
+    def test_failed_statement_is_dropped(self):
+        class FakeDB:
+            executor = None
+            written = []
+
+            async def transaction(self, statements):
+                for query, params in statements:
+                    await self.execute(query, params)
+
+            async def execute(self, query, params=()):
+                if query == 'BAD':
+                    raise sqlite3.IntegrityError()
+                self.written.append(params)
+
+        async def flush_twice():
+            queue.put('BAD', (1,), key='bad')
+            queue.put('GOOD', (2,))
+            await queue.flush()
+            self.assertEqual(list(queue.pending), ['bad'])
+            queue.put('GOOD', (3,))
+            await queue.flush()
+            queue.task.cancel()
+
+        queue = WriteBehindQueue(db=FakeDB(), flush_interval=1, max_pending=10, max_attempts=2)
+        with self.assertLogs('models.db', level='ERROR'):
+            asyncio.run(flush_twice())
+        self.assertEqual(FakeDB.written, [(2,), (3,)])
+        self.assertEqual(len(queue), 0)
+
+
+class FakeMetrics:
+    def __init__(self, text_width, text_height):
+        self.text_width = text_width
+        self.text_height = text_height
+
+
+class FakeDrawing:
+    font = 'Raleway'
+    stroke_width = 0
+
+    def __init__(self, font_size):
+        self.font_size = font_size
+
+    def get_font_metrics(self, image, text, multiline):
+        lines = text.split('\n')
+        return FakeMetrics(max(len(line) for line in lines) * self.font_size * 0.55,
+                           len(lines) * self.font_size * 1.3)
+
+
+class TextLayoutTests(unittest.TestCase):
+    WORDS = 'Kill Troops Gnome Campaign Tower Doom Legendary Unterwerfungsritual Gegner Soulforge a de la'.split()
+
+    @staticmethod
+    def linear_word_wrap(draw, text, roi_width, roi_height):
+        """Прежний перебор: уменьшаем шрифт по шагу, для каждого размера сужаем перенос по одной колонке"""
+        message = text
+        attempts = 100
+        while draw.font_size > 0 and attempts:
+            attempts -= 1
+            metrics = draw.get_font_metrics(None, message, True)
+            if metrics.text_height > roi_height:
+                draw.font_size -= TextLayout.FONT_STEP
+                message = text
+            elif metrics.text_width > roi_width:
+                columns = len(message)
+                while columns > 0:
+                    columns -= 1
+                    message = '\n'.join(wrap(message, columns))
+                    if draw.get_font_metrics(None, message, True).text_width <= roi_width:
+                        break
+                if columns < 1:
+                    draw.font_size -= TextLayout.FONT_STEP
+                    message = text
+            else:
+                return message
+        return None
+
+    def test_matches_linear_search(self):
+        rng = random.Random(1)
+        layout = TextLayout()
+        for _ in range(150):
+            text = ' '.join(rng.choice(self.WORDS) for _ in range(rng.randint(1, 12)))
+            roi_width, roi_height = rng.randint(100, 700), rng.randint(30, 200)
+            font_size = rng.choice([25, 30, 40, 60])
+            with self.subTest(text=text, roi=(roi_width, roi_height), font_size=font_size):
+                old_draw = FakeDrawing(font_size)
+                old_result = self.linear_word_wrap(old_draw, text, roi_width, roi_height)
+                draw = FakeDrawing(font_size)
+                try:
+                    result = layout.word_wrap(None, draw, text, roi_width, roi_height)
+                except RuntimeError:
+                    self.assertIsNone(old_result)
+                    continue
+                metrics = draw.get_font_metrics(None, result, True)
+                self.assertLessEqual(metrics.text_width, roi_width)
+                self.assertLessEqual(metrics.text_height, roi_height)
+                if old_result is not None:
+                    self.assertGreaterEqual(draw.font_size, old_draw.font_size)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -183,7 +183,7 @@ class Views:
                 troop['rarity_emoji'] = self.get_emoji_as_image(troop['raw_rarity'].lower())
             # Обрезаем описание заклинания, если оно слишком длинное и нужно его показывать
             if lengthened and len(troop['spell']['description']) > 180:
-                troop['spell']['description'] = troop['spell']['description'][:177] + '...'
+                troop['spell'] = {**troop['spell'], 'description': troop['spell']['description'][:177] + '...'}
 
         # Выбираем шаблон в зависимости от формата
         if shortened: